@@ -0,0 +1,187 @@
+"""
+data_bench.py
+
+Benchmark of the data_checker checks, the DataFixer stages and the split
+planner of data_split.py. Checks and fixer stages run on an existing dataset
+or on a synthetic one generated with data_synth. Each stage is timed and its
+peak memory recorded, so regressions in these hot paths show up as numbers.
+Memory is traced by tracemalloc in this process (pandas and numpy buffers are
+included, worker processes are not) in a separate run, as tracing slows down
+the code timed.
+
+Usage: python data_bench.py [--root DIR | --files N --rows N ...]
+    [--repeat N] [--workers N] [--output FILE.json]
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import unittest
+from contextlib import redirect_stdout
+
+from data_checker import Test
+from data_fixer import DataFixer
+from data_split_plan import index_files, plan_split
+from data_synth import generate_dataset
+
+CHECKS = list(unittest.TestLoader().getTestCaseNames(Test))
+FIXER_STAGES = ['trim_esd_data_plant', 'remove_xmeas_clean']
+
+
+def measure(func):
+    """ Wall time (s) of func() and its result. """
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def measure_memory(func):
+    """ Peak memory (bytes) traced while running func(). """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def copy_dataset(root, dst):
+    """ Copy setup.json and the split directories of a dataset to dst. """
+    with open(os.path.join(root, 'setup.json')) as f:
+        splits = json.load(f)['subsets']
+    os.makedirs(dst)
+    shutil.copy2(os.path.join(root, 'setup.json'), dst)
+    for split in splits:
+        shutil.copytree(os.path.join(root, split), os.path.join(dst, split))
+
+
+def run_fixer_stage(stage, root):
+    with redirect_stdout(io.StringIO()):
+        getattr(DataFixer(root), stage)()
+
+
+def run_checks(names):
+    """ Run the named checks of data_checker; number of failed ones. """
+    suite = unittest.TestSuite(Test(name) for name in names)
+    result = unittest.TestResult()
+    with redirect_stdout(io.StringIO()):
+        suite.run(result)
+    return len(result.failures) + len(result.errors)
+
+
+def bench(root, repeat=1, workers=0, profile=None):
+    """
+    Time every fixer stage once on a scratch copy of the dataset in root
+    (their memory is measured on another copy, so root is never modified),
+    then every check on its own with cold caches, then all the checks
+    together sharing the caches, keeping the best of repeat runs of each
+    check. With profile, a last run of all the checks writes the per-check
+    and per-file profile of data_checker to that path.
+    :return: list of dicts with stage, seconds, peak_mb and failures
+    """
+    root = os.path.abspath(root)
+    cwd = os.getcwd()
+    Test.workers = workers
+    Test.manifest = None
+    Test.incremental = False
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            memory_root = os.path.join(tmp_dir, 'memory')
+            time_root = os.path.join(tmp_dir, 'time')
+            copy_dataset(root, memory_root)
+            copy_dataset(root, time_root)
+            for stage in FIXER_STAGES:
+                peak = measure_memory(
+                    lambda: run_fixer_stage(stage, memory_root))
+                seconds, _ = measure(
+                    lambda: run_fixer_stage(stage, time_root))
+                results.append({'stage': f'fixer.{stage}',
+                                'seconds': seconds, 'peak_mb': peak / 2 ** 20,
+                                'failures': None})
+        os.chdir(root)
+        for stage, names in [(name, [name]) for name in CHECKS] + \
+                [('all_checks', CHECKS)]:
+            runs = []
+            for _ in range(repeat):
+                Test.reset_caches()
+                runs.append(measure(lambda: run_checks(names)))
+            seconds, failures = min(runs)
+            Test.reset_caches()
+            peak = measure_memory(lambda: run_checks(names))
+            results.append({'stage': f'checker.{stage}', 'seconds': seconds,
+                            'peak_mb': peak / 2 ** 20, 'failures': failures})
+        if profile:
+            Test.profile = os.path.abspath(os.path.join(cwd, profile))
+            Test.reset_caches()
+            run_checks(CHECKS)
+    finally:
+        Test.profile = None
+        Test.reset_caches()
+        os.chdir(cwd)
+    return results
+
+
+def bench_split_plan(n_scenarios, seed=0):
+    """
+    Time indexing and planning a split of n_scenarios source file names (no
+    files are needed), with the subset proportions of data_split.py.
+    """
+    filepaths = [os.path.join('src', f'res_IDV{i % 22}_{i}.csv')
+                 for i in range(n_scenarios)]
+    n_idv_files = n_scenarios // 22
+    subsets = {'train': n_idv_files * 92 // 100,
+               'train-dev': n_idv_files - n_idv_files * 92 // 100,
+               'val': n_scenarios * 2 // 5, 'test': n_scenarios * 2 // 5}
+    peak = measure_memory(
+        lambda: plan_split(index_files(filepaths), subsets, range(1, 22)))
+    seconds, _ = measure(
+        lambda: plan_split(index_files(filepaths), subsets, range(1, 22)))
+    return {'stage': 'split.plan_split', 'seconds': seconds,
+            'peak_mb': peak / 2 ** 20, 'failures': None}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--root', help='dataset to benchmark (not modified); '
+                                       'synthetic if not given')
+    parser.add_argument('--files', type=int, default=8,
+                        help='synthetic files per case_id and split')
+    parser.add_argument('--rows', type=int, help='synthetic rows per file')
+    parser.add_argument('--xmeas', type=int, help='synthetic XMEAS columns')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=0,
+                        help='data_checker workers (parallel mode if > 1)')
+    parser.add_argument('--plan-scenarios', type=int, default=10000,
+                        help='source scenarios of the split planning stage')
+    parser.add_argument('--output', help='write the results to this JSON')
+    parser.add_argument('--profile',
+                        help='write the data_checker profile of all the '
+                             'checks to this .json or .csv')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = args.root
+        if root is None:
+            root = os.path.join(tmp_dir, 'synthetic')
+            generate_dataset(
+                root, args.files, args.rows,
+                vars={'XMEAS': args.xmeas} if args.xmeas else None,
+                nan_files=1, flat_files=1, untrimmed_esd=True,
+                clean_cols=True, seed=args.seed)
+        results = bench(root, args.repeat, args.workers, args.profile)
+    results.append(bench_split_plan(args.plan_scenarios, args.seed))
+
+    print(f'{"stage":<40}{"seconds":>10}{"peak MB":>10}{"failures":>10}')
+    for result in results:
+        failures = '' if result['failures'] is None else result['failures']
+        print(f'{result["stage"]:<40}{result["seconds"]:>10.3f}'
+              f'{result["peak_mb"]:>10.1f}{failures:>10}')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,222 @@
+"""
+data_catalog.py
+
+Catalog of the data files of a dataset: one typed record per file (split,
+case_id, IDV, run, size, number of rows), built once and kept beside
+setup.json. Later runs only list the split directories and stat the files to
+reuse the records of unchanged files, and the res and plant files of the same
+scenario are paired through a dict instead of parsing file names again.
+"""
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from data_io import probe_csv, write_json
+from data_split_plan import parse_file_name
+
+# Catalog of the dataset files, beside setup.json
+CATALOG_FILE = '.catalog.json'
+# Fault segments of every file, beside setup.json
+FAULT_INDEX_FILE = '.fault_index.json'
+
+# name: file name without the case_id prefix, shared by the files of all the
+# case_ids of a scenario (e.g. IDV4_12.csv); idv and run are None if the name
+# has no IDV{idv}_{run}
+FileRecord = namedtuple(
+    'FileRecord', ['split', 'case_id', 'name', 'idv', 'run', 'file', 'path',
+                   'size', 'mtime_ns', 'n_rows'])
+
+
+def make_record(root, split, case_id, file):
+    """ Record of a data file, counting its rows with probe_csv. """
+    path = os.path.normpath(os.path.join(root, split, file))
+    stat = os.stat(path)
+    name = file[len(case_id):].lstrip('_')
+    idv, run = parse_file_name(name)
+    return FileRecord(split, case_id, name, idv, run, file, path,
+                      stat.st_size, stat.st_mtime_ns,
+                      probe_csv(path)['n_rows'])
+
+
+class DatasetCatalog:
+    """
+    Records of every data file of the dataset in root, with the settings of
+    its setup.json. Use DatasetCatalog.load to reuse the stored catalog.
+    """
+
+    def __init__(self, root, config, records):
+        self.root = root
+        self.path = os.path.join(root, CATALOG_FILE)
+        self.config = config
+        self.records = {}
+        # (split, case_id, name) -> record, to pair the files of a scenario
+        self.names = {}
+        self.paths = {}
+        # (case_id, split) -> file -> record, and its records sorted by file
+        # name, built on the first files() call after a change
+        self.groups = {}
+        self.sorted_groups = {}
+        self.changed = False
+        for record in records:
+            self.add(record)
+
+    @classmethod
+    def load(cls, root='.'):
+        """
+        Catalog of the dataset in root: stored records are kept for files
+        whose size and mtime did not change, new or changed files are
+        probed, and the catalog is saved if anything changed.
+        """
+        with open(os.path.join(root, 'setup.json')) as f:
+            config = json.load(f)
+        stored = {}
+        catalog_path = os.path.join(root, CATALOG_FILE)
+        if os.path.exists(catalog_path):
+            with open(catalog_path) as f:
+                for fields in json.load(f)['records']:
+                    path = os.path.normpath(
+                        os.path.join(root, fields['split'], fields['file']))
+                    record = FileRecord(path=path, **fields)
+                    stored[record.split, record.case_id, record.file] = record
+        catalog = cls(root, config, [])
+        pending = []
+        for split in config['subsets']:
+            split_dir = os.path.join(root, split)
+            if not os.path.isdir(split_dir):
+                continue
+            for file in os.listdir(split_dir):
+                if not file.endswith(config['extension']):
+                    continue
+                for case_id in config['case_id']:
+                    if not file.startswith(case_id):
+                        continue
+                    record = stored.get((split, case_id, file))
+                    if record is not None and catalog.is_current(record):
+                        catalog.add(record)
+                    else:
+                        pending.append((split, case_id, file))
+        # Counting rows reads (and decompresses) whole files; zlib and zstd
+        # release the GIL, so threads read several files at once
+        with ThreadPoolExecutor() as executor:
+            for record in executor.map(
+                    lambda key: make_record(root, *key), pending):
+                catalog.add(record)
+        catalog.changed = bool(pending) or \
+            len(catalog.records) != len(stored)
+        catalog.save()
+        return catalog
+
+    def add(self, record):
+        if record is not None:
+            key = (record.split, record.case_id, record.file)
+            self.records[key] = record
+            self.names[record.split, record.case_id, record.name] = record
+            self.paths[record.path] = record
+            group = (record.case_id, record.split)
+            self.groups.setdefault(group, {})[record.file] = record
+            self.sorted_groups.pop(group, None)
+
+    @staticmethod
+    def is_current(record):
+        """ Whether the file of record has the same size and mtime. """
+        stat = os.stat(record.path)
+        return (stat.st_size, stat.st_mtime_ns) == \
+            (record.size, record.mtime_ns)
+
+    def refresh(self, split, case_id, file):
+        """
+        Record of a file, probed again if its size or mtime changed (e.g.
+        after DataFixer rewrote it).
+        """
+        record = self.records.get((split, case_id, file))
+        if record is not None and self.is_current(record):
+            return record
+        record = make_record(self.root, split, case_id, file)
+        self.add(record)
+        self.changed = True
+        return record
+
+    def save(self):
+        if not self.changed:
+            return
+        records = []
+        for record in self.records.values():
+            fields = record._asdict()
+            del fields['path']
+            records.append(fields)
+        write_json(self.path, {'records': records})
+        self.changed = False
+
+    def files(self, case_id, split):
+        """ Records of the case_id files of a split, sorted by file name. """
+        group = (case_id, split)
+        if group not in self.sorted_groups:
+            files = self.groups.get(group, {})
+            self.sorted_groups[group] = [files[file] for file in sorted(files)]
+        return list(self.sorted_groups[group])
+
+    def file_dict(self):
+        """ dict case_id -> split -> sorted file names. """
+        return {case_id: {split: [record.file
+                                  for record in self.files(case_id, split)]
+                          for split in self.config['subsets']}
+                for case_id in self.config['case_id']}
+
+    def lookup(self, filepath):
+        """ Record of the file at filepath, None if not in the catalog. """
+        return self.paths.get(os.path.normpath(filepath))
+
+    def pair(self, record, case_id):
+        """ Record of the case_id file of the scenario of record, or None. """
+        return self.names.get((record.split, case_id, record.name))
+
+
+class FaultIndex:
+    """
+    Onset and offset rows of the faults of every data file, keyed by IDV and
+    split, as saved by the test_unique_faults check of data_checker. Each
+    entry holds the split, case_id, idv and file of a data file and its fault
+    segments [fault, first row, last row].
+    """
+
+    def __init__(self, root='.', entries=()):
+        self.root = root
+        self.path = os.path.join(root, FAULT_INDEX_FILE)
+        self.entries = {}
+        for entry in entries:
+            self.entries.setdefault((entry['idv'], entry['split']), []) \
+                .append(entry)
+
+    @classmethod
+    def load(cls, root='.'):
+        with open(os.path.join(root, FAULT_INDEX_FILE)) as f:
+            return cls(root, json.load(f)['entries'])
+
+    def add(self, record, segments):
+        """ Add the fault segments of the file of a catalog record. """
+        self.entries.setdefault((record.idv, record.split), []).append(
+            {'split': record.split, 'case_id': record.case_id,
+             'idv': record.idv, 'file': record.file, 'segments': segments})
+
+    def save(self):
+        write_json(self.path, {'entries': [
+            entry for entries in self.entries.values() for entry in entries]})
+
+    def files(self, idv=None, split=None, case_id=None):
+        """ Entries of the files of an IDV and split (any if None). """
+        keys = [(idv, split)] if idv is not None and split is not None \
+            else [key for key in self.entries
+                  if idv in (None, key[0]) and split in (None, key[1])]
+        return [entry for key in keys for entry in self.entries.get(key, [])
+                if case_id in (None, entry['case_id'])]
+
+    def onsets(self, idv, split=None, case_id='res'):
+        """
+        Path, onset and offset row of every segment of fault idv in the
+        files of that IDV (of a split, or all).
+        """
+        return [(os.path.normpath(os.path.join(
+                    self.root, entry['split'], entry['file'])), start, end)
+                for entry in self.files(idv, split, case_id)
+                for fault, start, end in entry['segments'] if fault == idv]
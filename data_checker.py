@@ -4,21 +4,669 @@ data_checker.py
 To check the integrity of the data in this directory
 """
 import os
+import hashlib
 import json
+import sys
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
 import numpy as np
 import pandas as pd
 
 from unittest import TestCase, skip
 
+from data_catalog import DatasetCatalog, FaultIndex
+from data_io import (atomic_write, content_fingerprint, file_stamp,
+                     probe_csv, read_chunks, read_frame, stamp_is_current,
+                     write_json)
+from data_split_plan import parse_file_name
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Results of the per-file checks of previous runs, beside setup.json
+MANIFEST_FILE = '.checker_manifest.json'
+# Slowest checks and files printed after a profiled run
+PROFILE_TOP = 10
+# Columns of a CSV profile, also when no per-file result was recorded
+PROFILE_CSV_COLUMNS = ['check', 'file', 'wall', 'parse', 'compute',
+                       'bytes_read', 'rss_delta', 'process_peak_rss',
+                       'cached']
+# Average data rows per block hash of the content fingerprints
+FINGERPRINT_BLOCK_ROWS = 64
+# How content fingerprints cut blocks, stored with their results so that
+# fingerprints cut otherwise are computed again
+FINGERPRINT_BOUNDARIES = 'row_crc'
+# Files of different subsets sharing at least this fraction of the row blocks
+# of the shorter one are near duplicates
+NEAR_DUPLICATE_SHARE = 0.5
+# Row blocks found in more files than this (e.g. a common initial steady
+# state) say nothing about leakage and are not compared
+COMMON_BLOCK_FILES = 8
+
+
+class FrameCache:
+    """
+    Least-recently-used store of the dataframes loaded by the checks, so each
+    file is parsed once per run instead of once per check. Frames are evicted
+    once their memory usage goes over max_bytes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.frames = OrderedDict()
+
+    def get(self, filepath, loader):
+        """
+        Return the frame of filepath, calling loader(filepath) on a miss. The
+        key includes size and mtime so files rewritten mid-run are reloaded.
+        """
+        stat = os.stat(filepath)
+        key = (os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns)
+        if key in self.frames:
+            self.frames.move_to_end(key)
+            return self.frames[key][0]
+        df = loader(filepath)
+        n_bytes = int(df.memory_usage(index=True, deep=True).sum())
+        if n_bytes > self.max_bytes:
+            return df
+        self.frames[key] = (df, n_bytes)
+        self.n_bytes += n_bytes
+        while self.n_bytes > self.max_bytes:
+            _, (_, evicted_bytes) = self.frames.popitem(last=False)
+            self.n_bytes -= evicted_bytes
+        return df
+
+    def clear(self):
+        self.frames.clear()
+        self.n_bytes = 0
+
+
+def check_length(probe, file, settings):
+    return probe['n_rows']
+
+
+def check_cols(probe, file, settings):
+    return probe['columns']
+
+
+def check_fingerprint(filepath, settings):
+    return content_fingerprint(filepath, settings['block_rows'])
+
+
+def find_duplicates(fingerprints, min_share=NEAR_DUPLICATE_SHARE,
+                    max_block_files=COMMON_BLOCK_FILES):
+    """
+    Pairs of files of different subsets with the same content ('exact') or
+    sharing at least min_share of the row blocks of the shorter file
+    ('near'), in time linear in the number of blocks: files are grouped by
+    content hash, and each file is only compared with the files found in the
+    postings of its blocks.
+    :param fingerprints: dict (subset, file) -> fingerprint of
+        content_fingerprint
+    :return: list of (kind, (subset, file), (subset, file), share)
+    """
+    duplicates = []
+    by_hash = {}
+    postings = {}
+    for key, fingerprint in fingerprints.items():
+        by_hash.setdefault(fingerprint['hash'], []).append(key)
+        for block in set(fingerprint['blocks']):
+            postings.setdefault(block, []).append(key)
+    exact = set()
+    for keys in by_hash.values():
+        for i, key_a in enumerate(keys):
+            for key_b in keys[i + 1:]:
+                if key_a[0] != key_b[0]:
+                    duplicates.append(('exact', key_a, key_b, 1.0))
+                    exact.add((key_a, key_b))
+    for key_a, fingerprint in fingerprints.items():
+        blocks_a = set(fingerprint['blocks'])
+        shared = Counter(
+            key_b for block in blocks_a
+            if len(postings[block]) <= max_block_files
+            for key_b in postings[block]
+            if key_b[0] != key_a[0] and key_b > key_a)
+        for key_b, n_shared in sorted(shared.items()):
+            n_blocks = min(len(blocks_a),
+                           len(set(fingerprints[key_b]['blocks'])))
+            share = n_shared / n_blocks
+            if share >= min_share and (key_a, key_b) not in exact \
+                    and (key_b, key_a) not in exact:
+                duplicates.append(('near', key_a, key_b, share))
+    return duplicates
+
+
+def generate_col_list(vars, has_clean_xmeas):
+    """ Columns a data file should have, in order, given setup.json vars. """
+    col_list = []
+    numbered_vars = ['XMEAS', 'XMV', 'SP', 'FMOL']
+    append_A_vars = ['UC', 'FMOL']
+    for var, max in vars.items():
+        # Main cases
+        if var in numbered_vars:
+            col_list += [f'{var}({i})' for i in range(1, max + 1)]
+        elif var == 'UC':
+            col_list += ['UCVR', 'UCLR', 'UCVS', 'UCLS', 'UCLC', 'UCVV']
+        elif var == 'fault':
+            # fault is skipped for the end
+            continue
+        else:
+            raise ValueError(
+                f'Variable {var} not implemented, check setup file')
+
+        # Loop to add special cases
+        if var in append_A_vars:
+            if var == 'UC':
+                col_list += ['UCVR_A', 'UCLR_A', 'UCVS_A', 'UCLS_A',
+                             'UCLC_A', 'UCVV_A']
+            else:
+                col_list += [f'{var}({i})_A' for i in range(1, max + 1)]
+    # Add XMEAS()_clean vars
+    if has_clean_xmeas and 'XMEAS' in vars.keys():
+        # Add XMEAS()_clean vars
+        max = vars['XMEAS']
+        col_list += [f'XMEAS({i})_clean' for i in range(1, max + 1)]
+    # Leave fault for the end
+    if 'fault' in vars:
+        col_list += ['fault']
+    return col_list
+
+
+class EqualRunTracker:
+    """
+    Longest run of consecutive equal values in each column of a 2-D array
+    fed in row chunks. Every chunk is processed as a whole matrix: repeated
+    rows are counted with a cumulative sum that restarts after every change
+    of value, and the count of the last row is carried to the next chunk so
+    runs spanning chunk boundaries are measured whole.
+    """
+
+    def __init__(self, n_cols):
+        self.n_rows = 0
+        self.last_row = None
+        # Repeats (rows equal to the previous one) ending at the last row
+        self.carry = np.zeros(n_cols, dtype=int)
+        self.best_repeats = np.zeros(n_cols, dtype=int)
+        self.best_ends = np.zeros(n_cols, dtype=int)
+
+    def update(self, values):
+        if len(values) == 0:
+            return
+        # equal[i] is True when row i repeats the previous row (NaN never does)
+        equal = np.empty(values.shape, dtype=bool)
+        equal[0] = False if self.last_row is None else \
+            values[0] == self.last_row
+        equal[1:] = values[1:] == values[:-1]
+        repeats = np.cumsum(equal, axis=0)
+        repeats -= np.maximum.accumulate(np.where(equal, 0, repeats), axis=0)
+        repeats += self.carry * ~np.logical_or.accumulate(~equal, axis=0)
+        ends = repeats.argmax(axis=0)
+        max_repeats = repeats[ends, np.arange(values.shape[1])]
+        better = max_repeats > self.best_repeats
+        self.best_repeats[better] = max_repeats[better]
+        self.best_ends[better] = ends[better] + self.n_rows
+        self.carry = repeats[-1]
+        self.last_row = values[-1]
+        self.n_rows += len(values)
+
+    def runs(self):
+        """
+        :return: run lengths, first rows and last rows of the longest runs,
+        per column
+        """
+        lengths = self.best_repeats + (self.n_rows > 0)
+        return lengths, self.best_ends - self.best_repeats, self.best_ends
+
+
+def max_equal_runs(values):
+    """ Longest run of consecutive equal values in each column of values. """
+    tracker = EqualRunTracker(values.shape[1])
+    tracker.update(values)
+    return tracker.runs()
+
+
+class NullColsCheck:
+    """ Columns (not ignored) holding NaN/null/None values. """
+
+    def __init__(self, file, settings):
+        self.settings = settings
+        self.cols = None
+
+    def update(self, df):
+        if self.cols is None:
+            self.cols = [col for col in df.columns
+                         if col not in self.settings['col_ignore_list']]
+            self.has_null = np.zeros(len(self.cols), dtype=bool)
+        self.has_null |= df[self.cols].isnull().to_numpy().any(axis=0)
+
+    def result(self):
+        if self.cols is None:
+            return []
+        return [col for col, has_null in zip(self.cols, self.has_null)
+                if has_null]
+
+
+class BuggedColsCheck:
+    """
+    Columns (not ignored) with more than max_consecutive_times consecutive
+    equal values, mapped to [run length, first row, last row] of their
+    longest run. Files of the ignored IDVs are not checked (None).
+    """
+
+    def __init__(self, file, settings):
+        self.settings = settings
+        # Same IDV as the catalog record of the file (see test_bugged_cols)
+        self.skip = parse_file_name(file)[0] in settings['ignore_idvs']
+        self.cols = None
+
+    def update(self, df):
+        if self.skip:
+            return
+        if self.cols is None:
+            self.cols = [col for col in df.columns
+                         if col not in self.settings['col_ignore_list']]
+            self.tracker = EqualRunTracker(len(self.cols))
+        self.tracker.update(df[self.cols].to_numpy())
+
+    def result(self):
+        if self.skip:
+            return None
+        if self.cols is None:
+            return {}
+        runs, starts, ends = self.tracker.runs()
+        return {col: [int(run), int(start), int(end)]
+                for col, run, start, end in zip(self.cols, runs, starts, ends)
+                if run > self.settings['max_consecutive_times']}
+
+
+class UniqueFaultsCheck:
+    """ Sorted values of the fault column. """
+
+    def __init__(self, file, settings):
+        self.faults = set()
+
+    def update(self, df):
+        self.faults.update(int(i) for i in df['fault'].unique())
+
+    def result(self):
+        return sorted(self.faults)
+
+
+class FaultSegmentsCheck:
+    """
+    Segments [fault, first row, last row] of consecutive rows with the same
+    value of the fault column, in order, i.e. the onset and offset of every
+    fault. A segment spanning chunks is merged into one.
+    """
+
+    def __init__(self, file, settings):
+        self.segments = []
+        self.n_rows = 0
+
+    def update(self, df):
+        faults = df['fault'].to_numpy()
+        if len(faults) == 0:
+            return
+        starts = np.flatnonzero(np.r_[True, faults[1:] != faults[:-1]])
+        ends = np.r_[starts[1:], len(faults)] - 1
+        for start, end in zip(starts, ends):
+            fault = int(faults[start])
+            if start == 0 and self.segments and self.segments[-1][0] == fault:
+                self.segments[-1][2] = int(end) + self.n_rows
+            else:
+                self.segments.append(
+                    [fault, int(start) + self.n_rows, int(end) + self.n_rows])
+        self.n_rows += len(faults)
+
+    def result(self):
+        return self.segments
+
+
+# Per-file checks reading the raw rows, without parsing them
+BYTE_CHECKS = {
+    'fingerprint': check_fingerprint,
+}
+# Per-file checks answered from the header and line count (probe_csv) only
+PROBE_CHECKS = {
+    'length': check_length,
+    'cols': check_cols,
+}
+# Per-file checks that need the data, fed the whole frame or row chunks of it
+FRAME_CHECKS = {
+    'null_cols': NullColsCheck,
+    'bugged_cols': BuggedColsCheck,
+    'unique_faults': UniqueFaultsCheck,
+    'fault_segments': FaultSegmentsCheck,
+}
+
+
+def peak_rss():
+    """ Peak resident memory of this process in bytes, None if unknown. """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def current_rss():
+    """ Resident memory of this process in bytes now, None if unknown. """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # No /proc (not Linux)
+        return None
+
+
+def run_file_checks(filepath, settings):
+    """
+    Run every frame check on one file in a single pass. The file is loaded
+    whole, or streamed in chunks of settings['chunksize'] rows so memory is
+    bounded by the chunk size. Used by the worker processes of the parallel
+    mode, so it only returns the small results. With settings['profile'],
+    the report also has the parse time, the compute time of each check, the
+    bytes read and how much the resident memory grew at most over the file,
+    sampled after every chunk ('profile'). A check that
+    raises on the file, or all of them if the file cannot be read, has its
+    exception stored in the report ('errors') instead, so the other checks
+    and files still get their results; a check that failed on a chunk is not
+    fed the next ones.
+    """
+    file = os.path.basename(filepath)
+    checks = {name: check_class(file, settings)
+              for name, check_class in FRAME_CHECKS.items()}
+    if settings['chunksize']:
+        chunks = read_chunks(filepath, settings['chunksize'],
+                             binary_cache=settings['binary_cache'])
+    else:
+        chunks = map(lambda path: read_frame(
+            path, binary_cache=settings['binary_cache']), [filepath])
+    parse = 0.
+    compute = dict.fromkeys(checks, 0.)
+    errors = {}
+    rss_start = rss_top = current_rss() if settings.get('profile') else None
+    while True:
+        start = time.perf_counter()
+        try:
+            chunk = next(chunks, None)
+        except Exception as error:
+            for name in checks:
+                errors.setdefault(name, error)
+            break
+        finally:
+            parse += time.perf_counter() - start
+        if chunk is None:
+            break
+        for name, check in checks.items():
+            if name in errors:
+                # Failed on an earlier chunk, its state is incomplete
+                continue
+            start = time.perf_counter()
+            try:
+                check.update(chunk)
+            except Exception as error:
+                errors[name] = error
+            compute[name] += time.perf_counter() - start
+        if rss_start is not None:
+            rss_top = max(rss_top, current_rss())
+    report = {}
+    for name, check in checks.items():
+        if name not in errors:
+            try:
+                report[name] = check.result()
+            except Exception as error:
+                errors[name] = error
+    if errors:
+        report['errors'] = errors
+    if settings.get('profile'):
+        report['profile'] = {
+            'parse': parse, 'compute': compute,
+            'bytes_read': os.path.getsize(filepath),
+            'rss_delta': None if rss_start is None else rss_top - rss_start}
+    return report
+
+
+def run_byte_checks(filepath, settings):
+    """
+    Run every byte check on one file, in the worker processes of the
+    parallel mode. The report is as the one of run_file_checks; byte checks
+    read raw rows, so all their time counts as parse time.
+    """
+    report = {}
+    errors = {}
+    parse = 0.
+    rss_start = rss_top = current_rss() if settings.get('profile') else None
+    for name, check in BYTE_CHECKS.items():
+        start = time.perf_counter()
+        try:
+            report[name] = check(filepath, settings)
+        except Exception as error:
+            errors[name] = error
+        parse += time.perf_counter() - start
+        if rss_start is not None:
+            rss_top = max(rss_top, current_rss())
+    if errors:
+        report['errors'] = errors
+    if settings.get('profile'):
+        report['profile'] = {
+            'parse': parse, 'compute': dict.fromkeys(BYTE_CHECKS, 0.),
+            'bytes_read': os.path.getsize(filepath),
+            'rss_delta': None if rss_start is None else rss_top - rss_start}
+    return report
+
+
+# Settings each per-file check depends on: its stored results are only
+# invalidated when one of these changes
+CHECK_DEPENDENCIES = {
+    'length': [],
+    'cols': [],
+    'null_cols': ['col_ignore_list'],
+    'bugged_cols': ['col_ignore_list', 'ignore_idvs',
+                    'max_consecutive_times'],
+    'unique_faults': [],
+    'fault_segments': [],
+    'fingerprint': ['block_rows', 'block_boundaries'],
+}
+
+
+def settings_fingerprint(settings, check):
+    """ Hash of the settings the per-file check depends on. """
+    deps = {key: settings[key] for key in CHECK_DEPENDENCIES[check]}
+    return hashlib.blake2b(json.dumps(deps, sort_keys=True).encode(),
+                           digest_size=8).hexdigest()
+
+
+class ResultManifest:
+    """
+    Results of the per-file checks persisted between runs, so that only the
+    files or checks whose inputs changed are checked again. Each file entry
+    keeps the stamp (size, mtime, hash) of the file its results come from,
+    and each result the fingerprint of the settings its check depends on.
+    Entries are keyed by the path of the file relative to the dataset root,
+    so runs started from different directories share them.
+    """
+
+    def __init__(self, root='.'):
+        self.root = root
+        self.path = os.path.join(root, MANIFEST_FILE)
+        self.files = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.files = json.load(f)['files']
+        # Files whose stamp was already verified in this run
+        self.verified = set()
+        self.changed = False
+
+    def key(self, filepath):
+        """ Key of filepath, its path relative to root with / separators. """
+        return os.path.relpath(filepath, self.root).replace(os.sep, '/')
+
+    def entry(self, filepath):
+        """ Entry of filepath, emptied if the file changed since stored. """
+        key = self.key(filepath)
+        entry = self.files.get(key)
+        if key in self.verified:
+            return entry
+        self.verified.add(key)
+        mtime_ns = entry and entry['stamp']['mtime_ns']
+        if entry is None or not stamp_is_current(filepath, entry['stamp']):
+            entry = {'stamp': file_stamp(filepath), 'checks': {}}
+            self.files[key] = entry
+            self.changed = True
+        elif entry['stamp']['mtime_ns'] != mtime_ns:
+            # Touched but unchanged file, only its stamp was updated
+            self.changed = True
+        return entry
+
+    def lookup(self, filepath, check, fingerprint):
+        """ Stored record of the check, or None if missing or stale. """
+        record = self.entry(filepath)['checks'].get(check)
+        if record is None or record['fingerprint'] != fingerprint:
+            return None
+        return record
+
+    def store(self, filepath, check, fingerprint, result):
+        self.entry(filepath)['checks'][check] = {
+            'fingerprint': fingerprint, 'result': result}
+        self.changed = True
+
+    def save(self):
+        """ Write the manifest, dropping the files that no longer exist. """
+        if not self.changed:
+            return
+        self.files = {key: entry for key, entry in self.files.items()
+                      if os.path.exists(os.path.join(self.root, key))}
+        write_json(self.path, {'files': self.files})
+        self.changed = False
+
+
+class CheckProfiler:
+    """
+    Wall time and process peak memory of every check, and wall, parse and
+    compute time, bytes read and memory growth of every per-file result of a
+    check, for a report of where the time of a run goes. Parse is the time
+    spent reading files (probe_csv, read_csv or the binary mirror), compute
+    the time spent in the check itself, and rss_delta how much the resident
+    memory grew while computing the result. Results reused from the manifest
+    are marked cached.
+    """
+
+    def __init__(self, dataset, settings):
+        self.dataset = dataset
+        self.settings = settings
+        self.checks = []
+        self.files = []
+
+    def add_check(self, check, wall):
+        self.checks.append({'check': check, 'wall': wall,
+                            'process_peak_rss': peak_rss()})
+
+    def add_file(self, check, filepath, wall=0., parse=0., compute=0.,
+                 bytes_read=0, rss_delta=None, cached=False):
+        self.files.append({'check': check, 'file': filepath, 'wall': wall,
+                           'parse': parse, 'compute': compute,
+                           'bytes_read': bytes_read, 'rss_delta': rss_delta,
+                           'cached': cached})
+
+    def top(self, n=PROFILE_TOP):
+        """ The n slowest checks and per-file results. """
+        return (sorted(self.checks, key=lambda row: -row['wall'])[:n],
+                sorted(self.files, key=lambda row: -row['wall'])[:n])
+
+    def save(self, path):
+        """
+        Write the report to path: as JSON (dataset, date and settings of the
+        run, every row and the slowest ones) or, for a .csv path, as one row
+        per per-file result plus one per check (file empty).
+        """
+        if path.endswith('.csv'):
+            with atomic_write(path, 'w') as f:
+                pd.DataFrame(self.files + self.checks,
+                             columns=PROFILE_CSV_COLUMNS).astype(
+                    dict.fromkeys(['bytes_read', 'rss_delta',
+                                   'process_peak_rss'], 'Int64')).to_csv(
+                    f, index=False)
+            return
+        top_checks, top_files = self.top()
+        write_json(path, {
+            'dataset': self.dataset,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'settings': self.settings,
+            'checks': self.checks, 'files': self.files,
+            'top_checks': top_checks, 'top_files': top_files})
+
+    def print_summary(self):
+        top_checks, top_files = self.top()
+        print(f'Slowest checks of {self.dataset}:')
+        for row in top_checks:
+            print(f'    {row["check"]}: {row["wall"]:.3f} s')
+        print('Slowest files:')
+        for row in top_files:
+            print(f'    {row["check"]} {row["file"]}: {row["wall"]:.3f} s '
+                  f'({row["parse"]:.3f} s parsing, {row["bytes_read"]} '
+                  f'bytes read)')
+
 
 class Test(TestCase):
+    # Directory of the dataset (with its setup.json), to check a dataset
+    # other than the current directory, e.g. in a subclass per dataset
+    root = '.'
+    # Shared by every test method; set DATA_CHECKER_CACHE_MB to change budget
+    frame_cache = FrameCache(
+        int(os.environ.get('DATA_CHECKER_CACHE_MB', 2048)) * 2 ** 20)
+    # Set DATA_CHECKER_WORKERS > 1 to run the per-file checks in parallel
+    workers = int(os.environ.get('DATA_CHECKER_WORKERS', 0))
+    file_reports = None
+    byte_reports = None
+    probes = {}
+    # Set DATA_CHECKER_INCREMENTAL=1 to reuse the results of previous runs
+    incremental = os.environ.get('DATA_CHECKER_INCREMENTAL', '0') == '1'
+    manifest = None
+    # Set DATA_CHECKER_CHUNKSIZE to stream the files in chunks of that many
+    # rows instead of loading them whole (no frame cache then)
+    chunksize = int(os.environ.get('DATA_CHECKER_CHUNKSIZE', 0))
+    stream_reports = {}
+    # Files of the dataset and settings of its setup.json, loaded once
+    catalog = None
+    # Set DATA_CHECKER_PROFILE to a .json or .csv path to write there the
+    # time, bytes read and peak memory of every check and file
+    profile = os.environ.get('DATA_CHECKER_PROFILE')
+    profiler = None
+    # Process pool shared by the datasets checked in one run, instead of one
+    # pool per dataset (see data_validate.py)
+    executor = None
+
+    @classmethod
+    def reset_caches(cls):
+        """ Forget the files loaded and the results computed in this run. """
+        cls.frame_cache.clear()
+        cls.probes.clear()
+        cls.stream_reports.clear()
+        cls.file_reports = None
+        cls.byte_reports = None
+        cls.catalog = None
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        if cls.manifest is not None:
+            cls.manifest.save()
+        if cls.profiler is not None:
+            cls.profiler.save(cls.profile)
+            cls.profiler.print_summary()
+            cls.profiler = None
 
     def setUp(self) -> None:
-        # Read setup json and store information of the dataset
-        setup_path = 'setup.json'
-        with open(setup_path) as f:
-            config = json.load(f)
+        self.started = time.perf_counter()
+        # Read setup json and catalog the files of the dataset, once per run
+        if type(self).catalog is None:
+            type(self).catalog = DatasetCatalog.load(self.root)
+        config = self.catalog.config
         self.name = config['name']
         self.data_len = config['length']
         self.n_files = config['subsets']
@@ -34,56 +682,209 @@ class Test(TestCase):
         self.extension = config['extension']
         self.case_id = tuple(config['case_id'])
         self.esd_idvs = config['esd_idvs']
+        self.binary_cache = config.get('binary_cache', False)
 
-        # Create file dictionary
-        file_dict_id = {}
-        for id in self.case_id:
-            file_dict = dict.fromkeys(self.dir_list, [])
-            for dir in self.dir_list:
-                file_dict[dir] = [
-                    file for file in os.listdir(dir)
-                    if file.endswith(self.extension) and file.startswith(id)]
-            file_dict_id[id] = file_dict
-        self.file_dict_id = file_dict_id
+        # Create file dictionary (sorted file names of each case_id and dir)
+        self.file_dict_id = self.catalog.file_dict()
 
         # Generate list of columns
         self.col_list = self.gererate_col_list()
         self.col_comp_list = self.generate_col_list_composition()
         self.col_ignore_list = self.generate_col_list_ignore()
 
-    def gererate_col_list(self):
-        col_list = []
-        numbered_vars = ['XMEAS', 'XMV', 'SP', 'FMOL']
-        append_A_vars = ['UC', 'FMOL']
-        for var, max in self.vars.items():
-            # Main cases
-            if var in numbered_vars:
-                col_list += [f'{var}({i})' for i in range(1, max + 1)]
-            elif var == 'UC':
-                col_list += ['UCVR', 'UCLR', 'UCVS', 'UCLS', 'UCLC', 'UCVV']
-            elif var == 'fault':
-                # fault is skipped for the end
-                continue
-            else:
-                raise ValueError(
-                    f'Variable {var} not implemented, check setup file')
+        # Settings the per-file checks need (picklable for the workers)
+        self.check_settings = {
+            'col_ignore_list': self.col_ignore_list,
+            'ignore_idvs': self.ignore_idvs,
+            'max_consecutive_times': self.max_consecutive_times,
+            'binary_cache': self.binary_cache,
+            'chunksize': self.chunksize,
+            'profile': bool(self.profile),
+            'block_rows': FINGERPRINT_BLOCK_ROWS,
+            'block_boundaries': FINGERPRINT_BOUNDARIES,
+        }
+        self.check_fingerprints = {
+            check: settings_fingerprint(self.check_settings, check)
+            for check in CHECK_DEPENDENCIES}
+        if self.incremental and type(self).manifest is None:
+            type(self).manifest = ResultManifest(self.root)
+        if self.profile and type(self).profiler is None:
+            type(self).profiler = CheckProfiler(self.name, {
+                'workers': self.workers, 'chunksize': self.chunksize,
+                'incremental': self.incremental,
+                'binary_cache': self.binary_cache})
+        # Parse time and bytes read by the file result being computed
+        self.usage = {'parse': 0., 'bytes_read': 0}
 
-            # Loop to add special cases
-            if var in append_A_vars:
-                if var == 'UC':
-                    col_list += ['UCVR_A', 'UCLR_A', 'UCVS_A', 'UCLS_A',
-                                 'UCLC_A', 'UCVV_A']
-                else:
-                    col_list += [f'{var}({i})_A' for i in range(1, max + 1)]
-        # Add XMEAS()_clean vars
-        if self.has_clean_xmeas and 'XMEAS' in self.vars.keys():
-            # Add XMEAS()_clean vars
-            max = self.vars['XMEAS']
-            col_list += [f'XMEAS({i})_clean' for i in range(1, max + 1)]
-        # Leave fault for the end
-        if 'fault' in self.vars:
-            col_list += ['fault']
-        return col_list
+    def tearDown(self) -> None:
+        if self.profiler is not None:
+            self.profiler.add_check(self._testMethodName,
+                                    time.perf_counter() - self.started)
+
+    def read_file(self, reader, filepath, whole=True):
+        """
+        reader(filepath), counted in the parse time and, if it reads the
+        whole file, in the bytes read.
+        """
+        start = time.perf_counter()
+        result = reader(filepath)
+        self.usage['parse'] += time.perf_counter() - start
+        if whole:
+            self.usage['bytes_read'] += os.path.getsize(filepath)
+        return result
+
+    def read_df(self, filepath):
+        """ Load a data file through the shared frame cache. """
+        return self.frame_cache.get(
+            filepath, lambda path: self.read_file(
+                lambda path: read_frame(path, binary_cache=self.binary_cache),
+                path))
+
+    def probe(self, filepath):
+        """
+        Header and line count of a data file, kept for the whole run. The
+        line count of the catalog is used while the file is unchanged, so
+        only the header is read.
+        """
+        stat = os.stat(filepath)
+        key = (os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns)
+        if key not in self.probes:
+            record = self.catalog.lookup(filepath)
+            n_rows = None
+            if record is not None and \
+                    (record.size, record.mtime_ns) == key[1:]:
+                n_rows = record.n_rows
+            self.probes[key] = self.read_file(
+                lambda path: probe_csv(path, n_rows=n_rows), filepath,
+                whole=n_rows is None)
+        return self.probes[key]
+
+    def file_result(self, filepath, check):
+        """
+        Result of the per-file check for filepath, taken from the manifest of
+        previous runs when incremental and still valid.
+        """
+        if self.manifest is not None:
+            fingerprint = self.check_fingerprints[check]
+            record = self.manifest.lookup(filepath, check, fingerprint)
+            if record is not None:
+                if self.profiler is not None:
+                    self.profiler.add_file(check, filepath, cached=True)
+                return record['result']
+        if self.profiler is None:
+            result = self.compute_file_result(filepath, check)
+        else:
+            self.usage = {'parse': 0., 'bytes_read': 0}
+            rss_start = current_rss()
+            start = time.perf_counter()
+            result = self.compute_file_result(filepath, check)
+            self.profile_file_result(
+                check, filepath, time.perf_counter() - start, rss_start)
+        if self.manifest is not None:
+            self.manifest.store(filepath, check, fingerprint, result)
+        return result
+
+    def profile_file_result(self, check, filepath, wall, rss_start):
+        """
+        Add the usage of a file result to the profiler. Results taken from
+        a report of run_file_checks get the parse time, bytes read and memory
+        growth of the report the first time only, and no waiting for the
+        other files. Otherwise the memory growth is the resident memory now
+        over rss_start, before the result was computed.
+        """
+        usage = self.usage
+        parse, bytes_read = usage['parse'], usage['bytes_read']
+        if 'compute' in usage:
+            rss_delta = usage['rss_delta']
+            usage['parse'], usage['bytes_read'] = 0., 0
+            usage['rss_delta'] = None if rss_delta is None else 0
+            compute = usage['compute'][check]
+            wall = parse + compute
+        else:
+            rss_now = current_rss()
+            rss_delta = None if rss_start is None or rss_now is None \
+                else rss_now - rss_start
+            compute = wall - parse
+        self.profiler.add_file(check, filepath, wall, parse, compute,
+                               bytes_read, rss_delta)
+
+    def report_result(self, report, check):
+        """
+        Result of a check from a report of run_file_checks, raising the
+        exception of the check if it failed on that file.
+        """
+        if 'profile' in report:
+            self.usage = report['profile']
+        if check in report.get('errors', {}):
+            raise report['errors'][check]
+        return report[check]
+
+    def compute_file_result(self, filepath, check):
+        """
+        Run the per-file check on filepath. Probe checks never load the file.
+        In parallel mode, frame and byte checks come from the reports of all
+        the files that need them, computed once per run.
+        """
+        file = os.path.basename(filepath)
+        if check in BYTE_CHECKS:
+            if self.workers > 1:
+                reports = self.run_parallel_checks(byte_checks=True)
+                if filepath in reports:
+                    return self.report_result(reports[filepath], check)
+            return self.read_file(lambda path: BYTE_CHECKS[check](
+                path, self.check_settings), filepath)
+        if check in PROBE_CHECKS:
+            return PROBE_CHECKS[check](
+                self.probe(filepath), file, self.check_settings)
+        if self.workers > 1:
+            reports = self.run_parallel_checks()
+            if filepath in reports:
+                return self.report_result(reports[filepath], check)
+        if self.chunksize:
+            # A single streaming pass per file runs all the frame checks
+            if filepath not in self.stream_reports:
+                self.stream_reports[filepath] = run_file_checks(
+                    filepath, self.check_settings)
+            return self.report_result(self.stream_reports[filepath], check)
+        frame_check = FRAME_CHECKS[check](file, self.check_settings)
+        frame_check.update(self.read_df(filepath))
+        return frame_check.result()
+
+    def run_parallel_checks(self, byte_checks=False):
+        """
+        Run every frame check (or every byte check, with byte_checks) on
+        every file with a process pool, one file per task. Reports are keyed
+        by file path, so the outcome does not depend on the number of workers
+        or the order tasks finish.
+        """
+        attr, runner, checks = \
+            ('byte_reports', run_byte_checks, BYTE_CHECKS) if byte_checks \
+            else ('file_reports', run_file_checks, FRAME_CHECKS)
+        if getattr(type(self), attr) is None:
+            filepaths = [record.path
+                         for id in self.case_id
+                         for dir in self.dir_list
+                         for record in self.catalog.files(id, dir)]
+            if self.manifest is not None:
+                filepaths = [
+                    filepath for filepath in filepaths
+                    if any(self.manifest.lookup(
+                        filepath, check, self.check_fingerprints[check])
+                        is None for check in checks)]
+            executor = self.executor
+            if executor is None:
+                executor = ProcessPoolExecutor(max_workers=self.workers)
+            try:
+                reports = executor.map(
+                    runner, filepaths, repeat(self.check_settings))
+                setattr(type(self), attr, dict(zip(filepaths, reports)))
+            finally:
+                if executor is not self.executor:
+                    executor.shutdown()
+        return getattr(type(self), attr)
+
+    def gererate_col_list(self):
+        return generate_col_list(self.vars, self.has_clean_xmeas)
 
     def generate_col_list_composition(self):
         start = self.xmeas_composition_dict['start']
@@ -115,12 +916,12 @@ class Test(TestCase):
 
     def test_dir_exists(self):
         for dir in self.dir_list:
-            self.assertTrue(os.path.exists(dir),
+            self.assertTrue(os.path.exists(os.path.join(self.root, dir)),
                             f'Directory {dir} does not exist')
 
     def test_not_empty(self):
         for dir in self.dir_list:
-            self.assertTrue(len(os.listdir(dir)) > 0)
+            self.assertTrue(len(os.listdir(os.path.join(self.root, dir))) > 0)
 
     def test_not_empty_filedict(self):
         for id in self.case_id:
@@ -135,7 +936,7 @@ class Test(TestCase):
 
     def test_needed_files(self):
         for file in self.needed_files:
-            self.assertTrue(os.path.exists(file))
+            self.assertTrue(os.path.exists(os.path.join(self.root, file)))
 
     def test_name_repeated(self):
         """
@@ -143,38 +944,56 @@ class Test(TestCase):
         other subset.
         """
         for id in self.case_id:
+            # Subsets of every file name, in one pass
+            dirs_of = {}
+            for dir in self.dir_list:
+                for file in self.file_dict_id[id][dir]:
+                    dirs_of.setdefault(file, []).append(dir)
             for dir1 in self.dir_list:
                 for file in self.file_dict_id[id][dir1]:
-                    for dir2 in self.dir_list:
-                        if dir1 == dir2:
-                            continue
-                        self.assertNotIn(
-                            file, self.file_dict_id[id][dir2],
+                    for dir2 in dirs_of[file]:
+                        self.assertEqual(
+                            dir1, dir2,
                             f'File {file} appears in both {dir1} and {dir2}')
 
+    def test_content_repeated(self):
+        """
+        The same scenario should not be in two subsets under any name: files
+        of different subsets with the same content, or sharing most of their
+        row blocks, are reported.
+        """
+        duplicates = []
+        for id in self.case_id:
+            fingerprints = {
+                (dir, record.file): self.file_result(
+                    record.path, 'fingerprint')
+                for dir in self.dir_list
+                for record in self.catalog.files(id, dir)}
+            duplicates += find_duplicates(fingerprints)
+        for kind, (dir1, file1), (dir2, file2), share in duplicates:
+            print(f'File {file1} in directory {dir1} and file {file2} in '
+                  f'directory {dir2} are {kind} duplicates ({share:.0%} of '
+                  f'their row blocks in common)')
+        self.assertTrue(len(duplicates) == 0,
+                        f'Some files are repeated in other subsets. See '
+                        f'above for details')
+
     def test_data_len(self):
         # Loop files in each directory
-        esd_flag = False
         failed_dict = {}
         for id in self.case_id:
             for dir in self.dir_list:
-                for file in self.file_dict_id[id][dir]:
+                for record in self.catalog.files(id, dir):
                     # First discard ESD cases that will have different length
-                    for idv in self.esd_idvs:
-                        if f'IDV{idv}_' in file:
-                            esd_flag = True
-                            break
-                    if esd_flag:
-                        esd_flag = False
-                        print("Skipping potential ESD case:", file)
+                    if record.idv in self.esd_idvs:
+                        print("Skipping potential ESD case:", record.file)
                         continue
 
                     # Now load file and check length
-                    filepath = os.path.join(dir, file)
-                    df = pd.read_csv(filepath, index_col='Time')
+                    length = self.file_result(record.path, 'length')
                     # Save the results and do the assert after processing all
-                    if len(df) != self.data_len:
-                        failed_dict[filepath] = len(df)
+                    if length != self.data_len:
+                        failed_dict[record.path] = length
         # Prints
         if len(failed_dict) > 0:
             print("Failed files:")
@@ -194,21 +1013,23 @@ class Test(TestCase):
         ref_id = self.case_id[0]
         next_id = self.case_id[1]
         for dir in self.dir_list:
-            for ref_file in self.file_dict_id[ref_id][dir]:
-                # Get case name and next file id
-                case_name = ref_file.strip(ref_id + '_')
-                next_file = f'{next_id}_{case_name}'
-                # Load files and compare lengths
-                ref_filepath = os.path.join(dir, ref_file)
-                ref_df = pd.read_csv(ref_filepath, index_col='Time')
-                next_filepath = os.path.join(dir, next_file)
-                next_df = pd.read_csv(next_filepath, index_col='Time')
+            for ref_record in self.catalog.files(ref_id, dir):
+                ref_file = ref_record.file
+                # Get the analogous file of the next case_id
+                next_record = self.catalog.pair(ref_record, next_id)
+                if next_record is None:
+                    print(f"File {ref_file} has no analogous {next_id} file")
+                    failed_dict[ref_file] = None
+                    continue
+                # Compare lengths
+                ref_len = self.file_result(ref_record.path, 'length')
+                next_len = self.file_result(next_record.path, 'length')
                 # Save the results and do the assert after processing all
-                if len(ref_df) != len(next_df):
-                    print(f"File {ref_file} has length {len(ref_df)}, but the "
-                          f"analogous file {next_file} has length "
-                          f"{len(next_df)}")
-                    failed_dict[ref_file] = len(ref_df)
+                if ref_len != next_len:
+                    print(f"File {ref_file} has length {ref_len}, but the "
+                          f"analogous file {next_record.file} has length "
+                          f"{next_len}")
+                    failed_dict[ref_file] = ref_len
         self.assertTrue(len(failed_dict) == 0,
                         f'Some files failed the length test.')
 
@@ -231,13 +1052,13 @@ class Test(TestCase):
         failed_dict = {}
         for id in self.case_id:
             for dir in self.dir_list:
-                for file in self.file_dict_id[id][dir]:
-                    filepath = os.path.join(dir, file)
-                    df = pd.read_csv(filepath, index_col='Time')
-                    if df.columns.to_list() != self.col_list:
+                for record in self.catalog.files(id, dir):
+                    file = record.file
+                    cols = self.file_result(record.path, 'cols')
+                    if cols != self.col_list:
                         print(f'File {file} in directory {dir} has wrong '
                               f'columns')
-                        failed_dict[file] = len(df.columns)
+                        failed_dict[file] = len(cols)
         self.assertTrue(len(failed_dict) == 0,
                         f'Some files failed the test. See above for details')
 
@@ -249,16 +1070,11 @@ class Test(TestCase):
         """
         for id in self.case_id:
             for dir in self.dir_list:
-                for file in self.file_dict_id[id][dir]:
-                    filepath = os.path.join(dir, file)
-                    df = pd.read_csv(filepath, index_col='Time')
-                    for col in df.columns:
-                        if col in self.col_ignore_list:
-                            continue
-                        self.assertFalse(
-                            df[col].isnull().values.any(),
-                            f'File {file} in directory {dir} has NaN values'
-                            f' in column {col}')
+                for record in self.catalog.files(id, dir):
+                    null_cols = self.file_result(record.path, 'null_cols')
+                    for col in null_cols:
+                        self.fail(f'File {record.file} in directory {dir} '
+                                  f'has NaN values in column {col}')
 
     def test_bugged_cols(self):
         """
@@ -269,35 +1085,25 @@ class Test(TestCase):
         """
         max_consecutive_times = self.max_consecutive_times
         fault_dict = {}
-        ignore_flag = False
         for id in self.case_id:
             for dir in self.dir_list:
-                for file in self.file_dict_id[id][dir]:
-                    filepath = os.path.join(dir, file)
-                    df = pd.read_csv(filepath, index_col='Time')
+                for record in self.catalog.files(id, dir):
+                    file = record.file
                     # Ignore specific IDVs that are known to have issues
-                    for idv in self.ignore_idvs:
-                        if f'IDV{idv}_' in file:
-                            ignore_flag = True
-                    if ignore_flag:
-                        ignore_flag = False
+                    if record.idv in self.ignore_idvs:
                         continue
                     # Check every column of the file
-                    for col in df.columns:
-                        if col in self.col_ignore_list:
-                            continue
-                        if df[col].diff().eq(0) \
-                                .rolling(max_consecutive_times).sum() \
-                                .gt(max_consecutive_times - 1).any():
-                            if file in fault_dict:
-                                fault_dict[file].append(col)
-                            else:
-                                fault_dict[file] = [col]
+                    bugged_cols = self.file_result(record.path, 'bugged_cols')
+                    if bugged_cols:
+                        fault_dict[file] = list(bugged_cols)
                     if file in fault_dict:
                         print(
                             f'File {file} in directory {dir} has more than'
                             f' {max_consecutive_times} consecutive equal'
                             f' values in columns {fault_dict[file]}')
+                        for col, (run, start, end) in bugged_cols.items():
+                            print(f'    {col}: {run} equal values in rows'
+                                  f' {start}-{end}')
         self.assertTrue(len(fault_dict) == 0, f'Some files failed the test.'
                                               f'See above for details')
 
@@ -305,19 +1111,23 @@ class Test(TestCase):
         """
         Check the values in the fault columns are only 0 if the filename
         contains 'IDV0_', or 0 and "idv" if the file contains 'IDV{idv}_'.
+        The rows where each fault starts and ends are saved in the fault
+        index of the dataset on the way.
         """
+        fault_index = FaultIndex(self.catalog.root)
+        file_faults = []
         for id in self.case_id:
             for dir in self.dir_list:
-                for file in self.file_dict_id[id][dir]:
-                    filepath = os.path.join(dir, file)
-                    df = pd.read_csv(filepath, index_col='Time')
-                    if 'IDV0_' in file:
-                        self.assertEqual(df['fault'].unique(), [0])
-                    else:
-                        # Obtain idv from filename
-                        idv = int(
-                            [item for item in file.split('_')
-                             if 'IDV' in item][0].strip('IDV')
-                        )
-                        for i in df['fault'].unique():
-                            self.assertIn(i, [0, idv])
+                for record in self.catalog.files(id, dir):
+                    # Both results of a file in a row, so it is loaded once
+                    fault_index.add(record, self.file_result(
+                        record.path, 'fault_segments'))
+                    file_faults.append((record, self.file_result(
+                        record.path, 'unique_faults')))
+        fault_index.save()
+        for record, faults in file_faults:
+            if record.idv == 0:
+                self.assertEqual(faults, [0])
+            else:
+                for i in faults:
+                    self.assertIn(i, [0, record.idv])
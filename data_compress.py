@@ -0,0 +1,71 @@
+"""
+data_compress.py
+
+Convert the data files of a dataset in place to another extension, e.g. from
+.csv to .csv.gz or .csv.zst (or back), and set it in setup.json. Files are
+converted in parallel, one per process, streamed through decompression and
+compression. All the new files are written before setup.json is updated and
+the old files removed, so an interrupted run leaves the dataset as it was.
+
+Usage: python data_compress.py EXTENSION [--root DIR] [--workers N]
+"""
+import argparse
+import json
+import os
+import re
+
+from data_catalog import DatasetCatalog
+from data_io import atomic_write, convert_data, data_suffix
+from data_loader import map_files
+
+
+def convert_file(filepath, extension, new_extension):
+    """ Write filepath with new_extension instead of extension. """
+    convert_data(filepath, filepath[:-len(extension)] + new_extension)
+
+
+def set_extension(setup_path, extension):
+    """
+    Set the extension of setup.json, replacing only its value so the rest
+    of the file keeps its formatting.
+    """
+    with open(setup_path) as f:
+        text = f.read()
+    text = re.sub(r'("extension"\s*:\s*)"[^"]*"',
+                  lambda match: match.group(1) + json.dumps(extension), text)
+    with atomic_write(setup_path, 'w') as f:
+        f.write(text)
+
+
+def convert_dataset(extension, root='.', workers=None):
+    """
+    Convert every data file of the dataset in root to extension (a CSV
+    suffix such as '.csv', '.csv.gz' or '.csv.zst').
+    """
+    if not extension.startswith('.csv') or \
+            data_suffix('file' + extension) != extension:
+        raise ValueError(f'Extension {extension} is not a CSV extension')
+    catalog = DatasetCatalog.load(root)
+    old_extension = catalog.config['extension']
+    if extension == old_extension:
+        print(f'Dataset {root} already uses {extension}')
+        return
+    filepaths = sorted({record.path for record in catalog.records.values()})
+    print(f'Converting {len(filepaths)} files from {old_extension} to '
+          f'{extension}')
+    for _ in map_files(convert_file, filepaths, old_extension, extension,
+                       workers=workers):
+        pass
+    set_extension(os.path.join(root, 'setup.json'), extension)
+    for filepath in filepaths:
+        os.remove(filepath)
+    DatasetCatalog.load(root)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('extension', help='new extension, e.g. .csv.gz')
+    parser.add_argument('--root', default='.', help='dataset directory')
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+    convert_dataset(args.extension, args.root, args.workers)
@@ -1,18 +1,21 @@
 """
 Fix data issues such as non-trimmed ESD cases.
-"""
-import json
-import os
 
-import pandas as pd
+Files are fixed without parsing them: rows are trimmed at a byte offset and
+columns dropped by streaming the lines, so untouched values stay
+byte-identical. Every rewrite goes through a temporary file and a rename, so
+an interrupted run never leaves a half-written file.
+"""
+from data_catalog import DatasetCatalog
+from data_io import project_columns, read_header, truncate_rows
 
 
 class DataFixer:
-    def __init__(self):
-        # Read setup json and store information of the dataset
-        setup_path = 'setup.json'
-        with open(setup_path) as f:
-            config = json.load(f)
+    def __init__(self, root='.'):
+        # Read setup json and catalog the files of the dataset in root
+        self.root = root
+        self.catalog = DatasetCatalog.load(root)
+        config = self.catalog.config
         self.name = config['name']
         self.data_len = config['length']
         self.n_files = config['subsets']
@@ -29,15 +32,7 @@ class DataFixer:
         self.esd_idvs = config['esd_idvs']
 
         # Create file dictionary
-        file_dict_id = {}
-        for id in self.case_id:
-            file_dict = dict.fromkeys(self.dir_list, [])
-            for dir in self.dir_list:
-                file_dict[dir] = [
-                    file for file in os.listdir(dir)
-                    if file.endswith(self.extension) and file.startswith(id)]
-            file_dict_id[id] = file_dict
-        self.file_dict_id = file_dict_id
+        self.file_dict_id = self.catalog.file_dict()
 
     def trim_esd_data_plant(self):
         """
@@ -45,23 +40,26 @@ class DataFixer:
         knowing that 'res' files are already trimmed.
         :return:
         """
-        for dir, filelist in self.file_dict_id['res'].items():
-            for file in filelist:
-                for idv in self.esd_idvs:
-                    if f'IDV{idv}_' not in file:
-                        continue
-                    # Get length of the res file and trim res file down to it
-                    res_filepath = os.path.join(dir, file)
-                    res_df = pd.read_csv(res_filepath)
-                    plant_filepath = os.path.join(
-                        dir, f'plant_{file.strip("res_")}')
-                    plant_df = pd.read_csv(plant_filepath)
-                    if len(res_df) == len(plant_df):
-                        print(f"File {plant_filepath} was already trimmed")
-                        continue
-                    print(f"Trimming file {plant_filepath}")
-                    plant_df = plant_df.iloc[:len(res_df)]
-                    plant_df.to_csv(plant_filepath, index=False)
+        for dir in self.dir_list:
+            for res in self.catalog.files('res', dir):
+                if res.idv not in self.esd_idvs:
+                    continue
+                # Get length of the res file and trim plant file down to it
+                plant = self.catalog.pair(res, 'plant')
+                if plant is None:
+                    print(f"WARNING: File {res.path} has no plant file")
+                    continue
+                if res.n_rows == plant.n_rows:
+                    print(f"File {plant.path} was already trimmed")
+                    continue
+                if plant.n_rows < res.n_rows:
+                    print(f"File {plant.path} is shorter than {res.path}, "
+                          f"it cannot be trimmed")
+                    continue
+                print(f"Trimming file {plant.path}")
+                truncate_rows(plant.path, res.n_rows)
+                self.catalog.refresh(dir, 'plant', plant.file)
+        self.catalog.save()
 
     def remove_xmeas_clean(self):
         """
@@ -69,17 +67,19 @@ class DataFixer:
         detection.
         """
         for file_id in self.case_id:
-            for dir, filelist in self.file_dict_id[file_id].items():
-                for file in filelist:
-                    # Get filepath and check if the file contains 'clean' cols
-                    filepath = os.path.join(dir, file)
-                    df = pd.read_csv(filepath, index_col='Time')
-                    if not any('_clean' in col for col in df.columns):
+            for dir in self.dir_list:
+                for record in self.catalog.files(file_id, dir):
+                    # Check if the file contains 'clean' cols
+                    cols = read_header(record.path)
+                    if not any('_clean' in col for col in cols):
                         continue
                     # Remove clean cols and re-write
-                    print(f"Removing _clean columns from {filepath}")
-                    df = df[[col for col in df.columns if '_clean' not in col]]
-                    df.to_csv(filepath)
+                    print(f"Removing _clean columns from {record.path}")
+                    project_columns(
+                        record.path,
+                        [col for col in cols if '_clean' not in col])
+                    self.catalog.refresh(dir, file_id, record.file)
+        self.catalog.save()
 
     def __call__(self, *args, **kwargs):
         """ Call all class methods."""
@@ -0,0 +1,421 @@
+"""
+data_io.py
+
+Shared readers for the data files of the dataset, with an optional binary
+mirror of the CSV files to avoid parsing them again on every run. Data files
+may be compressed (e.g. .csv.gz or .csv.zst, as the extension of setup.json
+says); they are then read and rewritten through (de)compression streams.
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+import zlib
+from contextlib import closing, contextmanager
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+# Mirror directory, created beside the split directories (train, val, ...)
+CACHE_DIR = '.npcache'
+# Read size when hashing or counting lines in binary mode
+READ_CHUNK_SIZE = 2 ** 20
+# Compression of a data file, from the last suffix of its name (zstd needs
+# the zstandard package)
+COMPRESSIONS = {'.gz': 'gzip', '.zst': 'zstd'}
+# Fast levels, as data files are rewritten by the fixer
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def file_hash(filepath):
+    """ Fast content hash of a file, read in large binary chunks. """
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def file_stamp(filepath, with_hash=True):
+    """ Size, mtime and (optionally) content hash of a file. """
+    stat = os.stat(filepath)
+    stamp = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if with_hash:
+        stamp['hash'] = file_hash(filepath)
+    return stamp
+
+
+def stamp_is_current(filepath, stamp):
+    """
+    Whether filepath still matches a stamp from file_stamp. When size and
+    mtime changed but the hash did not (e.g. the file was copied or touched),
+    the stamp is updated in place and the file counts as unchanged.
+    """
+    new_stamp = file_stamp(filepath, with_hash=False)
+    if new_stamp['size'] != stamp['size']:
+        return False
+    if new_stamp['mtime_ns'] == stamp['mtime_ns']:
+        return True
+    if stamp.get('hash') != file_hash(filepath):
+        return False
+    stamp['mtime_ns'] = new_stamp['mtime_ns']
+    return True
+
+
+def compression_of(filepath):
+    """ Compression of a data file from its name, None if not compressed. """
+    return COMPRESSIONS.get(os.path.splitext(filepath)[1])
+
+
+def data_suffix(file):
+    """ Suffix of a data file name, e.g. '.csv' or '.csv.gz'. """
+    stem, suffix = os.path.splitext(file)
+    if suffix in COMPRESSIONS:
+        suffix = os.path.splitext(stem)[1] + suffix
+    return suffix
+
+
+def wrap_stream(f, filepath, mode='rb'):
+    """
+    Binary stream that decompresses (mode 'rb') or compresses (mode 'wb') f
+    as the name of filepath says, or f itself if it is not compressed.
+    Closing the stream leaves f open.
+    """
+    compression = compression_of(filepath)
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=f, mode=mode, compresslevel=GZIP_LEVEL)
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(f'Reading or writing {filepath} needs the '
+                              f'zstandard package')
+        if 'r' in mode:
+            return io.BufferedReader(
+                zstandard.ZstdDecompressor().stream_reader(f, closefd=False),
+                READ_CHUNK_SIZE)
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(
+            f, closefd=False)
+    return f
+
+
+@contextmanager
+def open_data(filepath):
+    """ Binary reader of the (decompressed) content of a data file. """
+    with open(filepath, 'rb') as f, closing(wrap_stream(f, filepath)) as src:
+        yield src
+
+
+def content_fingerprint(filepath, block_rows):
+    """
+    Hash of the (decompressed) content of a data file and hashes of blocks
+    of its data rows, to find copies of the file under other names (same
+    hash) or partial copies (shared block hashes). A block ends after every
+    row whose CRC is a multiple of block_rows, so blocks are block_rows rows
+    long on average and their boundaries depend on the rows only: a copy
+    with rows added or removed still shares the blocks of the rest.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    blocks = []
+
+    def add_block(rows):
+        block = b''.join(rows)
+        hasher.update(block)
+        blocks.append(hashlib.blake2b(block, digest_size=8).hexdigest())
+
+    with open_data(filepath) as f:
+        hasher.update(f.readline())
+        rows = []
+        for row in f:
+            rows.append(row)
+            if zlib.crc32(row.rstrip(b'\r\n')) % block_rows == 0:
+                add_block(rows)
+                rows = []
+        if rows:
+            add_block(rows)
+    return {'hash': hasher.hexdigest(), 'blocks': blocks}
+
+
+def split_header(header):
+    """ Column names of a raw CSV header line. """
+    return [col.strip().strip('"')
+            for col in header.decode().rstrip('\r\n').split(',')]
+
+
+def read_header(filepath):
+    """ Column names of a CSV file, index column included. """
+    with open_data(filepath) as f:
+        return split_header(f.readline())
+
+
+def count_rows(f):
+    """ Number of data rows left in a binary CSV stream, counting newlines. """
+    n_rows = 0
+    # Newlines ending what was read so far; a run of them (blank lines) may
+    # span several chunks
+    n_end_newlines = 0
+    chunk = b''
+    for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+        n_rows += chunk.count(b'\n')
+        row_end = len(chunk.rstrip(b'\r\n'))
+        if row_end:
+            n_end_newlines = 0
+        n_end_newlines += chunk.count(b'\n', row_end)
+    # Last row without a trailing newline, or blank lines skipped by pandas
+    if n_end_newlines == 0 and chunk:
+        n_rows += 1
+    elif n_end_newlines > 1:
+        n_rows -= n_end_newlines - 1
+    return n_rows
+
+
+def probe_csv(filepath, index_col='Time', n_rows=None):
+    """
+    Column names and number of data rows of a CSV file without parsing it:
+    only the header is decoded and the rows are counted as newlines in large
+    binary chunks. The columns exclude index_col, as in a frame read with it.
+    With n_rows (e.g. from the dataset catalog), only the header is read.
+    """
+    with open_data(filepath) as f:
+        header = f.readline()
+        if n_rows is None:
+            n_rows = count_rows(f)
+    columns = split_header(header)
+    if index_col is not None:
+        columns.remove(index_col)
+    return {'columns': columns, 'n_rows': n_rows}
+
+
+def mirror_paths(filepath):
+    """ Paths of the binary data and metadata mirroring a CSV file. """
+    split_dir, file = os.path.split(filepath)
+    mirror_dir = os.path.join(
+        os.path.dirname(split_dir), CACHE_DIR, os.path.basename(split_dir))
+    base = os.path.join(mirror_dir, file)
+    return base + '.npy', base + '.json'
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    Temporary path beside path, renamed over path once written, so readers
+    and interrupted runs never see a partially written file.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f'.{os.path.basename(path)}.', suffix='.tmp',
+        dir=os.path.dirname(path) or '.')
+    os.close(fd)
+    try:
+        yield tmp_path
+        if os.path.exists(path):
+            mode = os.stat(path).st_mode & 0o7777
+        else:
+            # mkstemp creates the file private, use the usual mode instead
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def atomic_write(path, mode='wb'):
+    """ Open a file that atomically replaces path once written. """
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+
+
+@contextmanager
+def atomic_write_data(path):
+    """ atomic_write of a data file, compressed as its name says. """
+    with atomic_write(path) as f:
+        dst = wrap_stream(f, path, 'wb')
+        yield dst
+        if dst is not f:
+            # Flush the end of the compressed stream before the rename
+            dst.close()
+
+
+def convert_data(src_path, dst_path):
+    """
+    Write the content of data file src_path to dst_path, decompressing and
+    compressing as their names say, as a stream.
+    """
+    with open_data(src_path) as src, atomic_write_data(dst_path) as dst:
+        for chunk in iter(lambda: src.read(READ_CHUNK_SIZE), b''):
+            dst.write(chunk)
+
+
+def write_json(path, obj):
+    """ Write obj as JSON atomically. """
+    with atomic_write(path, 'w') as f:
+        json.dump(obj, f)
+
+
+def write_mirror(filepath, df, stamp):
+    """
+    Store df (parsed from filepath) as a single float64 .npy matrix whose
+    first column is the index, plus the names and dtypes needed to rebuild
+    the frame. Frames with non-numeric columns are not mirrored.
+    """
+    dtypes = [df.index.dtype] + df.dtypes.to_list()
+    if not all(np.issubdtype(dtype, np.number) for dtype in dtypes):
+        return
+    npy_path, meta_path = mirror_paths(filepath)
+    os.makedirs(os.path.dirname(npy_path), exist_ok=True)
+    values = np.empty((len(df), df.shape[1] + 1), dtype=np.float64)
+    values[:, 0] = df.index.to_numpy()
+    values[:, 1:] = df.to_numpy(dtype=np.float64)
+    with atomic_write(npy_path) as f:
+        np.save(f, values)
+    write_json(meta_path, {
+        'stamp': stamp,
+        'index_col': df.index.name,
+        'columns': df.columns.to_list(),
+        'dtypes': [str(dtype) for dtype in dtypes],
+    })
+
+
+def load_mirror(filepath, index_col, mmap_mode=None):
+    """
+    Matrix and metadata of the mirror of filepath, or None if missing or
+    stale. With mmap_mode, the matrix is memory-mapped instead of read.
+    """
+    npy_path, meta_path = mirror_paths(filepath)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta['index_col'] != index_col:
+        return None
+    mtime_ns = meta['stamp']['mtime_ns']
+    if not stamp_is_current(filepath, meta['stamp']):
+        return None
+    if meta['stamp']['mtime_ns'] != mtime_ns:
+        write_json(meta_path, meta)
+    return np.load(npy_path, mmap_mode=mmap_mode), meta
+
+
+def mirror_frame(values, meta):
+    """ Rebuild the frame of (a row slice of) a mirror matrix. """
+    index_dtype, *dtypes = meta['dtypes']
+    index = pd.Index(values[:, 0].astype(index_dtype),
+                     name=meta['index_col'])
+    df = pd.DataFrame(np.array(values[:, 1:]), index=index,
+                      columns=meta['columns'])
+    int_cols = {col: dtype for col, dtype in zip(meta['columns'], dtypes)
+                if dtype != 'float64'}
+    if int_cols:
+        df = df.astype(int_cols)
+    return df
+
+
+def read_mirror(filepath, index_col):
+    """ Frame of filepath from its mirror, or None if missing or stale. """
+    mirror = load_mirror(filepath, index_col)
+    if mirror is None:
+        return None
+    return mirror_frame(*mirror)
+
+
+def read_frame(filepath, index_col='Time', binary_cache=False):
+    """
+    Read a data file into a dataframe. With binary_cache, the frame is read
+    from the binary mirror of the file, which is (re)built whenever the size,
+    mtime or hash of the CSV changes.
+    """
+    if not binary_cache:
+        return pd.read_csv(filepath, index_col=index_col)
+    df = read_mirror(filepath, index_col)
+    if df is None:
+        # Stamp before parsing, so a write during the parse is noticed later
+        stamp = file_stamp(filepath)
+        df = pd.read_csv(filepath, index_col=index_col)
+        write_mirror(filepath, df, stamp)
+    return df
+
+
+def read_chunks(filepath, chunksize, index_col='Time', binary_cache=False):
+    """
+    Iterate over a data file in frames of chunksize rows, so memory stays
+    bounded by the chunk size whatever the file size. With binary_cache, a
+    valid mirror is memory-mapped and sliced instead of parsing the CSV (it is
+    not built here, as that needs the whole frame).
+    """
+    mirror = None
+    if binary_cache:
+        mirror = load_mirror(filepath, index_col, mmap_mode='r')
+    if mirror is None:
+        yield from pd.read_csv(filepath, index_col=index_col,
+                               chunksize=chunksize)
+        return
+    values, meta = mirror
+    for start in range(0, len(values), chunksize):
+        yield mirror_frame(values[start:start + chunksize], meta)
+
+
+def rows_end_offset(filepath, n_rows):
+    """
+    Byte offset where the first n_rows data rows of a CSV file end, found by
+    counting newlines in large binary chunks (in the decompressed content if
+    compressed). The content size if it is shorter.
+    """
+    with open_data(filepath) as f:
+        offset = len(f.readline())
+        remaining = n_rows
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            count = chunk.count(b'\n')
+            if count < remaining:
+                remaining -= count
+                offset += len(chunk)
+                continue
+            pos = -1
+            for _ in range(remaining):
+                pos = chunk.index(b'\n', pos + 1)
+            return offset + pos + 1
+    return offset
+
+
+def truncate_rows(filepath, n_rows):
+    """
+    Keep the header and the first n_rows data rows of a CSV file, copying
+    its bytes up to the end of the last kept row (no parsing, so the kept
+    rows are byte-identical). The file is replaced atomically.
+    """
+    n_bytes = rows_end_offset(filepath, n_rows)
+    with open_data(filepath) as src, atomic_write_data(filepath) as dst:
+        while n_bytes > 0:
+            chunk = src.read(min(READ_CHUNK_SIZE, n_bytes))
+            if not chunk:
+                break
+            dst.write(chunk)
+            n_bytes -= len(chunk)
+
+
+def project_columns(filepath, columns):
+    """
+    Rewrite a CSV file with the given columns only, streaming it line by
+    line and copying the kept fields as they are (values are not parsed or
+    reformatted). The file is replaced atomically.
+    """
+    with open_data(filepath) as src, atomic_write_data(filepath) as dst:
+        header = src.readline()
+        names = split_header(header)
+        indices = [names.index(col) for col in columns]
+        for line in chain([header], src):
+            row = line.rstrip(b'\r\n')
+            if row:
+                fields = row.split(b',')
+                dst.write(b','.join([fields[i] for i in indices]))
+            dst.write(line[len(row):])
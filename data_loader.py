@@ -0,0 +1,179 @@
+"""
+data_loader.py
+
+Load the splits of the dataset (train, train-dev, val, test) for training, as
+one contiguous float32 array per split with the selected features only.
+"""
+import json
+import os
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice, repeat
+
+import numpy as np
+import pandas as pd
+
+from data_catalog import DatasetCatalog
+
+# values: (n_rows, n_features) float32 array of all the files of the split,
+# labels: fault of every row, offsets: rows of file i are
+# offsets[i]:offsets[i + 1], files: file names, columns: feature names
+SplitData = namedtuple(
+    'SplitData', ['values', 'labels', 'offsets', 'files', 'columns'])
+
+
+def read_config(root='.'):
+    """ Settings of the dataset in root, from its setup.json. """
+    with open(os.path.join(root, 'setup.json')) as f:
+        return json.load(f)
+
+
+def feature_columns(features_path='features_detect.csv', role='input'):
+    """
+    Names of the features selected in a features file: the ones not dropped
+    in features_detect.csv ('drop' column), or the ones used as role ('input'
+    or 'output') in features_detect_gauss_nn.csv. The fault label is never a
+    feature.
+    """
+    features = pd.read_csv(features_path, index_col='index')
+    if 'drop' in features.columns:
+        selected = features['drop'] == 0
+    else:
+        selected = features[role] == 1
+    return [col for col in features.loc[selected, 'name'] if col != 'fault']
+
+
+def split_files(split, case_id='res', root='.', catalog=None):
+    """ Sorted paths of the files of a case_id in a split directory. """
+    if catalog is None:
+        catalog = DatasetCatalog.load(root)
+    return [record.path for record in catalog.files(case_id, split)]
+
+
+def read_columns(filepath, columns):
+    """
+    Parse only the given columns (as float32) and the fault label of a file.
+    :return: (n_rows, len(columns)) float32 array and fault labels
+    """
+    df = pd.read_csv(filepath, usecols=columns + ['fault'],
+                     dtype=dict.fromkeys(columns, np.float32))
+    return (df[columns].to_numpy(dtype=np.float32),
+            df['fault'].to_numpy(dtype=np.int32))
+
+
+def map_files(func, filepaths, *args, workers=None, prefetch=None):
+    """
+    func(filepath, *args) for every file, in order, with a process pool of
+    workers processes (os.cpu_count() if None, serial if 0 or 1). Only
+    prefetch files (2 * workers by default) are submitted ahead of the result
+    being used, so the results waiting in memory stay bounded whatever the
+    number of files.
+    """
+    if workers is not None and workers <= 1:
+        yield from map(func, filepaths, *[repeat(arg) for arg in args])
+        return
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if prefetch is None:
+        prefetch = 2 * workers
+    filepaths = iter(filepaths)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        queue = deque(executor.submit(func, filepath, *args)
+                      for filepath in islice(filepaths, prefetch))
+        while queue:
+            result = queue.popleft().result()
+            for filepath in islice(filepaths, 1):
+                queue.append(executor.submit(func, filepath, *args))
+            yield result
+
+
+def load_split(split, columns=None, case_id='res', root='.', workers=None):
+    """
+    Load every case_id file of a split into one contiguous float32 array,
+    parsing only the feature columns (those of features_detect.csv by
+    default) in parallel. Row counts come from the dataset catalog, so each
+    file is copied into its final place as soon as it is parsed.
+    :return: SplitData
+    """
+    if columns is None:
+        columns = feature_columns(os.path.join(root, 'features_detect.csv'))
+    records = DatasetCatalog.load(root).files(case_id, split)
+    filepaths = [record.path for record in records]
+    n_rows = [record.n_rows for record in records]
+    offsets = np.zeros(len(filepaths) + 1, dtype=np.int64)
+    np.cumsum(n_rows, out=offsets[1:])
+    values = np.empty((offsets[-1], len(columns)), dtype=np.float32)
+    labels = np.empty(offsets[-1], dtype=np.int32)
+    loaded = map_files(read_columns, filepaths, columns, workers=workers)
+    for i, (file_values, file_labels) in enumerate(loaded):
+        if len(file_values) != n_rows[i]:
+            raise ValueError(f'File {filepaths[i]} has {len(file_values)} '
+                             f'rows but {n_rows[i]} lines')
+        values[offsets[i]:offsets[i + 1]] = file_values
+        labels[offsets[i]:offsets[i + 1]] = file_labels
+    files = [record.file for record in records]
+    return SplitData(values, labels, offsets, files, columns)
+
+
+def file_windows(filepath, columns, window, stride):
+    """
+    Windows of window consecutive rows of a file, every stride rows, and the
+    fault label of the last row of each window.
+    :return: (n_windows, window, len(columns)) float32 array and labels
+    """
+    values, labels = read_columns(filepath, columns)
+    if len(values) < window:
+        return (np.empty((0, window, len(columns)), dtype=np.float32),
+                np.empty(0, dtype=np.int32))
+    windows = np.lib.stride_tricks.sliding_window_view(
+        values, window, axis=0)[::stride]
+    return (np.ascontiguousarray(windows.transpose(0, 2, 1)),
+            labels[window - 1::stride])
+
+
+def iter_windows(split, window, stride=1, batch_size=256, columns=None,
+                 case_id='res', root='.', workers=4, prefetch=None,
+                 seed=None):
+    """
+    Yield batches (windows, labels) of windows of window rows taken every
+    stride rows from the case_id files of a split, as float32 arrays of shape
+    (batch_size, window, n_features) (the last batch may be smaller). Windows
+    never cross file boundaries, and their label is the fault of their last
+    row. A pool of workers threads loads and windows the next files (up to
+    prefetch files ahead, 2 * workers by default) while the current batches
+    are used. With seed, file order and windows of each file are shuffled.
+    """
+    if columns is None:
+        columns = feature_columns(os.path.join(root, 'features_detect.csv'))
+    filepaths = split_files(split, case_id, root)
+    rng = None
+    if seed is not None:
+        rng = np.random.default_rng(seed)
+        filepaths = [filepaths[i] for i in rng.permutation(len(filepaths))]
+    if prefetch is None:
+        prefetch = 2 * workers
+    pending_windows = np.empty((0, window, len(columns)), dtype=np.float32)
+    pending_labels = np.empty(0, dtype=np.int32)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def submit(filepath):
+            return executor.submit(
+                file_windows, filepath, columns, window, stride)
+        queue = deque(submit(filepath) for filepath in filepaths[:prefetch])
+        next_files = deque(filepaths[prefetch:])
+        while queue:
+            windows, labels = queue.popleft().result()
+            if next_files:
+                queue.append(submit(next_files.popleft()))
+            if rng is not None:
+                order = rng.permutation(len(windows))
+                windows, labels = windows[order], labels[order]
+            pending_windows = np.concatenate([pending_windows, windows])
+            pending_labels = np.concatenate([pending_labels, labels])
+            n_full = len(pending_windows) // batch_size * batch_size
+            for start in range(0, n_full, batch_size):
+                yield (pending_windows[start:start + batch_size],
+                       pending_labels[start:start + batch_size])
+            pending_windows = pending_windows[n_full:]
+            pending_labels = pending_labels[n_full:]
+    if len(pending_windows) > 0:
+        yield pending_windows, pending_labels
@@ -0,0 +1,171 @@
+"""
+data_split_plan.py
+
+Plan which source scenarios go to each split (train, train-dev, val, test)
+before copying anything. File names are parsed once into an index by IDV, and
+the plan is drawn from it with a seeded generator, so planning thousands of
+scenarios takes milliseconds and gives the same plan whatever the order
+os.listdir returns.
+
+Planned files are then materialized in the dataset directories by copying,
+or by hardlinking, reflinking or symlinking them to save time and disk space.
+"""
+import errno
+import json
+import os
+import random
+import re
+import shutil
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from data_io import convert_data, data_suffix, write_json
+
+# Scenario file names contain IDV{idv}_{run}, e.g. res_IDV4_12.csv
+FILE_PATTERN = re.compile(r'IDV(\d+)_(\d+)')
+MATERIALIZE_MODES = ('copy', 'hardlink', 'reflink', 'symlink')
+# ioctl request to clone a file (Linux, on btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+def parse_file_name(file):
+    """ IDV and run of a scenario file name, (None, None) if it has none. """
+    match = FILE_PATTERN.search(file)
+    if match is None:
+        return None, None
+    return int(match.group(1)), int(match.group(2))
+
+
+def index_files(filepaths):
+    """
+    Parse IDV and run number of every file once.
+    :return: dict idv -> list of (run, filepath) sorted by run, so the index
+        does not depend on the order of filepaths
+    """
+    index = {}
+    for filepath in filepaths:
+        idv, run = parse_file_name(os.path.basename(filepath))
+        if idv is None:
+            print(f'WARNING: File {filepath} has no IDV and run in its name')
+            continue
+        index.setdefault(idv, []).append((run, filepath))
+    for files in index.values():
+        files.sort()
+    return index
+
+
+def plan_split(index, subsets, fault_idvs, noc_subsets=('train', 'train-dev'),
+               seed=0):
+    """
+    Draw the files of every subset from an index of index_files, without
+    repetition. NOC subsets only get IDV0 files; the others are stratified by
+    IDV, taking one file of each of fault_idvs in turn until the subset size
+    is reached (IDVs whose files run out are skipped).
+    :param subsets: dict subset -> number of files, e.g. setup.json subsets
+    :return: dict subset -> list of filepaths
+    """
+    rng = random.Random(seed)
+    pools = {}
+    for idv, files in sorted(index.items()):
+        pools[idv] = [filepath for _, filepath in files]
+        rng.shuffle(pools[idv])
+
+    plan = {}
+    for subset, size in subsets.items():
+        if subset in noc_subsets:
+            n_files = min(size, len(pools.get(0, [])))
+            plan[subset] = [pools[0].pop() for _ in range(n_files)]
+        else:
+            plan[subset] = []
+            idvs = [idv for idv in fault_idvs if pools.get(idv)]
+            while len(plan[subset]) < size and idvs:
+                for idv in idvs:
+                    if len(plan[subset]) == size:
+                        break
+                    plan[subset].append(pools[idv].pop())
+                idvs = [idv for idv in idvs if pools[idv]]
+        if len(plan[subset]) < size:
+            print(f'WARNING: Only {len(plan[subset])} files available for '
+                  f'{subset}, {size} requested')
+    return plan
+
+
+def write_plan(path, plan, seed):
+    """ Save a plan as a JSON manifest, before any file is copied. """
+    write_json(path, {'seed': seed, 'subsets': plan})
+
+
+def read_plan(path):
+    with open(path) as f:
+        return json.load(f)['subsets']
+
+
+def reflink(src, dst):
+    """
+    Copy-on-write clone of src as dst, sharing its data blocks. An existing
+    dst raises FileExistsError, as with os.link.
+    """
+    import fcntl
+    # 'x' fails on an existing dst, so only a dst created here is removed
+    with open(src, 'rb') as src_f, open(dst, 'xb') as dst_f:
+        try:
+            fcntl.ioctl(dst_f.fileno(), FICLONE, src_f.fileno())
+        except OSError:
+            dst_f.close()
+            os.remove(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def materialize(src, dst, mode='copy'):
+    """
+    Make src available at dst (a file path or a directory, as in
+    shutil.copy2) by copying, hardlinking, reflinking or symlinking it. Falls
+    back to copying when the link cannot be made, e.g. across filesystems.
+    Linked files are safe to fix with DataFixer, which replaces files instead
+    of writing into them. A dst with another data suffix than src (e.g.
+    .csv.gz for a .csv) gets the content of src converted instead.
+    :return: mode actually used ('convert' for a conversion)
+    """
+    if mode not in MATERIALIZE_MODES:
+        raise ValueError(f'Mode {mode} not in {MATERIALIZE_MODES}')
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+    if data_suffix(src) != data_suffix(dst):
+        if os.path.exists(dst):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST),
+                                  dst)
+        convert_data(src, dst)
+        return 'convert'
+    try:
+        if mode == 'hardlink':
+            os.link(src, dst)
+        elif mode == 'reflink':
+            reflink(src, dst)
+        elif mode == 'symlink':
+            os.symlink(os.path.abspath(src), dst)
+        else:
+            shutil.copy2(src, dst)
+        return mode
+    except (OSError, ImportError) as error:
+        # Only a failed link falls back to a copy, never an existing file
+        if mode == 'copy' or getattr(error, 'errno', None) == errno.EEXIST:
+            raise
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+def materialize_files(pairs, mode='copy', workers=8):
+    """
+    Materialize every (src, dst) pair with a pool of workers threads, so the
+    copies (requested or fallbacks) and conversions overlap their I/O.
+    :return: Counter of the modes actually used
+    """
+    pairs = list(pairs)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        modes = Counter(executor.map(
+            lambda pair: materialize(*pair, mode), pairs))
+    if mode != 'copy' and modes['copy']:
+        print(f'WARNING: {modes["copy"]} files were copied instead of '
+              f'{mode}ed')
+    return modes
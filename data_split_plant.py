@@ -5,9 +5,11 @@ data\rieth_mcavoy_36\residuals in the new `test` and `val` sets
 Only copy the files that match the names of those in
 """
 
+import json
 import os
 import pandas as pd
-import shutil
+from data_io import data_suffix
+from data_split_plan import materialize_files
 
 # Directory init
 src_dir_1 = os.path.join('..', 'rieth_mcavoy_36', 'raw', 'train')
@@ -15,34 +17,43 @@ src_dir_2 = os.path.join('..', 'rieth_mcavoy_36', 'raw', 'test')
 src_dirs = [src_dir_1, src_dir_2]
 dst_dirs = ['train', 'train-dev', 'val', 'test']
 idv_path = 'teidv.csv'
+# How files get to the new dataset: 'copy', or 'hardlink', 'reflink' or
+# 'symlink' to share the source files (copied if the link cannot be made).
+# Source files with another suffix than the extension of setup.json are
+# converted to it instead
+mode = 'copy'
+with open('setup.json') as f:
+    extension = json.load(f)['extension']
 
-# Get list of all plant files from source
+# Get list of all plant files from source (CSV, compressed or not), by case
 n_train = 92
 n_train_dev = 8
 filedict = {}
 for src_dir in src_dirs:
     for file in os.listdir(src_dir):
-        if file.endswith('.csv'):
-            filedict[file] = os.path.join(src_dir, file)
+        suffix = data_suffix(file)
+        if suffix.startswith('.csv'):
+            filedict[file[:-len(suffix)]] = os.path.join(src_dir, file)
 
 
 # Go over dst files, check equivalent filenames in src and copy them
+pairs = []
 for dst_dir in dst_dirs:
     for file in os.listdir(dst_dir):
-        if file.endswith('.csv'):
+        suffix = data_suffix(file)
+        if suffix.startswith('.csv') and file.startswith('res_'):
             # Get case name
-            case_name = file.strip('res_').strip('.csv')
-            src_plant_filename = f'{case_name}.csv'
-            dst_plant_filename = f'plant_{src_plant_filename}'
+            case_name = file[len('res_'):-len(suffix)]
             # Check if file is in src
-            if src_plant_filename in filedict.keys():
+            if case_name in filedict.keys():
+                dst_plant_filename = f'plant_{case_name}{extension}'
                 dst_path = os.path.join(dst_dir, dst_plant_filename)
                 # Skip if file already exists
                 if os.path.exists(os.path.join(dst_path)):
                     print(
                         f'WARNING: File {file} already exists in destination')
                     continue
-                # Copy file
-                shutil.copy2(filedict[src_plant_filename], dst_path)
+                pairs.append((filedict[case_name], dst_path))
             else:
                 print(f'WARNING: File {file} not found in source directory')
+materialize_files(pairs, mode)
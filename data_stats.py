@@ -0,0 +1,208 @@
+"""
+data_stats.py
+
+Profile the columns of every data file in one pass: count, NaN count, min,
+max, mean, std, number of unique values and longest run of equal values. The
+per-file profiles are computed in parallel and merged into split-level
+profiles with mergeable moments, so fitting scalers or comparing splits
+reads the stats tables instead of the data.
+
+Run this file to profile the dataset of the current directory.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_catalog import DatasetCatalog
+from data_checker import EqualRunTracker, generate_col_list
+from data_io import atomic_write, probe_csv, read_chunks, read_frame
+from data_loader import map_files
+
+# Stats directory, created beside the split directories (train, val, ...)
+STATS_DIR = '.stats'
+# Columns of the stats tables; m2 is the sum of squared deviations from the
+# mean, kept so profiles can be merged
+STATS_COLUMNS = ['count', 'nan_count', 'min', 'max', 'mean', 'm2', 'std',
+                 'n_unique', 'flat_run']
+
+
+def merge_moments(n_a, mean_a, m2_a, n_b, mean_b, m2_b):
+    """
+    Count, mean and m2 of the union of two samples from theirs (Chan et
+    al.), element-wise. Samples with no values are neutral.
+    """
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight_b = np.where(n > 0, n_b / n, 0)
+        mean = np.where(n_b > 0, mean_a + delta * weight_b, mean_a)
+        m2 = np.where(n_b > 0, m2_a + m2_b + delta ** 2 * n_a * weight_b,
+                      m2_a)
+    return n, mean, m2
+
+
+class ColumnStats:
+    """
+    Stats of the given columns of a file fed whole or in row chunks. Moments
+    of every chunk are merged into the running ones, so the result does not
+    depend on the chunk size.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        n_cols = len(columns)
+        self.count = np.zeros(n_cols, dtype=np.int64)
+        self.nan_count = np.zeros(n_cols, dtype=np.int64)
+        self.min = np.full(n_cols, np.nan)
+        self.max = np.full(n_cols, np.nan)
+        self.mean = np.zeros(n_cols)
+        self.m2 = np.zeros(n_cols)
+        self.uniques = [[] for _ in columns]
+        self.tracker = EqualRunTracker(n_cols)
+
+    def update(self, df):
+        values = df[self.columns].to_numpy(dtype=np.float64)
+        if len(values) == 0:
+            return
+        is_nan = np.isnan(values)
+        count = len(values) - is_nan.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.nansum(values, axis=0) / count
+        m2 = np.nansum((values - mean) ** 2, axis=0)
+        self.count, self.mean, self.m2 = merge_moments(
+            self.count, self.mean, self.m2, count, np.nan_to_num(mean), m2)
+        self.nan_count += len(values) - count
+        self.min = np.fmin(self.min, np.min(values, axis=0, initial=np.inf,
+                                            where=~is_nan))
+        self.max = np.fmax(self.max, np.max(values, axis=0, initial=-np.inf,
+                                            where=~is_nan))
+        # Sorting puts NaN last, so unique values end where the NaNs start
+        sorted_values = np.sort(values, axis=0)
+        for i, uniques in enumerate(self.uniques):
+            col = sorted_values[:count[i], i]
+            uniques.append(col[np.r_[True, col[1:] != col[:-1]]])
+        self.tracker.update(values)
+
+    def result(self):
+        """ :return: dataframe of STATS_COLUMNS indexed by column """
+        n_unique = [len(np.unique(np.concatenate(uniques))) if uniques else 0
+                    for uniques in self.uniques]
+        empty = self.count == 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(self.m2 / (self.count - 1))
+        return pd.DataFrame({
+            'count': self.count,
+            'nan_count': self.nan_count,
+            'min': np.where(empty, np.nan, self.min),
+            'max': np.where(empty, np.nan, self.max),
+            'mean': np.where(empty, np.nan, self.mean),
+            'm2': self.m2,
+            'std': std,
+            'n_unique': n_unique,
+            'flat_run': self.tracker.runs()[0],
+        }, index=pd.Index(self.columns, name='column'))
+
+
+def file_stats(filepath, columns, chunksize=0, binary_cache=False):
+    """
+    Stats of the columns of a file that it has, in one pass over the whole
+    frame or over chunks of chunksize rows.
+    """
+    if chunksize:
+        chunks = read_chunks(filepath, chunksize, binary_cache=binary_cache)
+    else:
+        chunks = [read_frame(filepath, binary_cache=binary_cache)]
+    stats = None
+    for chunk in chunks:
+        if stats is None:
+            stats = ColumnStats([col for col in columns if col in chunk])
+        stats.update(chunk)
+    if stats is None:
+        # No rows to read in chunks
+        stats = ColumnStats([col for col in columns
+                             if col in probe_csv(filepath)['columns']])
+    return stats.result()
+
+
+def merge_stats(stats, by):
+    """
+    Merge a table of per-file stats (as in profile_dataset) into one row per
+    group of the by columns and column, combining the moments of all the
+    files of a group at once. n_unique is not mergeable and is dropped.
+    """
+    keys = by + ['column']
+    grouped = stats.assign(
+        weighted_mean=stats['mean'].fillna(0) * stats['count']).groupby(
+        keys, sort=False)
+    merged = grouped.agg(count=('count', 'sum'),
+                         nan_count=('nan_count', 'sum'),
+                         min=('min', 'min'), max=('max', 'max'),
+                         weighted_mean=('weighted_mean', 'sum'),
+                         flat_run=('flat_run', 'max'))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        merged['mean'] = merged.pop('weighted_mean') / merged['count']
+    # m2 of a group: m2 of its files plus the spread of their means
+    means = merged['mean'].reindex(
+        pd.MultiIndex.from_frame(stats[keys])).to_numpy()
+    spread = stats['count'] * (stats['mean'].fillna(0) - means) ** 2
+    merged['m2'] = (stats['m2'] + spread.fillna(0).to_numpy()).groupby(
+        [stats[key] for key in keys], sort=False).sum()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        merged['std'] = np.sqrt(merged['m2'] / (merged['count'] - 1))
+    return merged.reset_index()[
+        keys + [col for col in STATS_COLUMNS if col != 'n_unique']]
+
+
+def stats_paths(root='.'):
+    """ Paths of the per-file and per-split stats tables. """
+    stats_dir = os.path.join(root, STATS_DIR)
+    return (os.path.join(stats_dir, 'files.csv'),
+            os.path.join(stats_dir, 'splits.csv'))
+
+
+def profile_dataset(root='.', workers=None, chunksize=0):
+    """
+    Profile every data file of the dataset in root with a process pool, one
+    file per task, over the columns of generate_col_list, and merge the
+    profiles of each split and case_id. Both tables are saved in STATS_DIR.
+    :return: per-file and per-split stats tables
+    """
+    catalog = DatasetCatalog.load(root)
+    config = catalog.config
+    columns = generate_col_list(config['vars'], config['has_clean_xmeas'])
+    records = [record for case_id in config['case_id']
+               for split in config['subsets']
+               for record in catalog.files(case_id, split)]
+    profiles = map_files(
+        file_stats, [record.path for record in records], columns, chunksize,
+        config.get('binary_cache', False), workers=workers)
+    stats = pd.concat(
+        [profile.reset_index().assign(
+            split=record.split, case_id=record.case_id, file=record.file)
+         for record, profile in zip(records, profiles)], ignore_index=True)
+    stats = stats[['split', 'case_id', 'file', 'column'] + STATS_COLUMNS]
+    split_stats = merge_stats(stats, ['split', 'case_id'])
+
+    files_path, splits_path = stats_paths(root)
+    os.makedirs(os.path.dirname(files_path), exist_ok=True)
+    for path, table in [(files_path, stats), (splits_path, split_stats)]:
+        with atomic_write(path, 'w') as f:
+            table.to_csv(f, index=False)
+    return stats, split_stats
+
+
+def read_stats(root='.'):
+    """ Per-file and per-split stats tables saved by profile_dataset. """
+    return tuple(pd.read_csv(path) for path in stats_paths(root))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--root', default='.', help='dataset directory')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--chunksize', type=int, default=0,
+                        help='stream files in chunks of this many rows')
+    args = parser.parse_args()
+    profile_dataset(args.root, args.workers, args.chunksize)
@@ -0,0 +1,114 @@
+"""
+data_store.py
+
+Pack each split directory into one memory-mapped array file with an index
+of the row span of every file, for random access to (file, rows) slices
+without parsing CSVs. Reads are zero-copy views of the mapped file, so
+processes on the same node share the page cache instead of private copies.
+
+Run this file to build the stores of every split in setup.json.
+"""
+import json
+import os
+
+import numpy as np
+
+from data_catalog import DatasetCatalog
+from data_io import atomic_path, write_json
+from data_loader import feature_columns, map_files, read_columns, read_config
+
+# Store directory, created beside the split directories (train, val, ...)
+STORE_DIR = '.store'
+
+
+def store_paths(split, root='.'):
+    """ Paths of the values, labels and index files of a split store. """
+    base = os.path.join(root, STORE_DIR, split)
+    return base + '.npy', base + '.labels.npy', base + '.json'
+
+
+def build_store(split, columns=None, root='.', workers=None):
+    """
+    Pack the files of every case_id of a split into a float32 matrix with the
+    given feature columns (those of features_detect.csv by default) and
+    their fault labels, written straight into memory-mapped files so memory
+    stays bounded by the few files map_files keeps in flight per worker.
+    """
+    catalog = DatasetCatalog.load(root)
+    if columns is None:
+        columns = feature_columns(os.path.join(root, 'features_detect.csv'))
+    records = []
+    filepaths = []
+    n_rows = 0
+    for case_id in catalog.config['case_id']:
+        for record in catalog.files(case_id, split):
+            start = n_rows
+            n_rows += record.n_rows
+            records.append({'case_id': case_id, 'idv': record.idv,
+                            'file': record.file, 'start': start,
+                            'stop': n_rows})
+            filepaths.append(record.path)
+
+    values_path, labels_path, index_path = store_paths(split, root)
+    os.makedirs(os.path.dirname(values_path), exist_ok=True)
+    with atomic_path(values_path) as tmp_values_path, \
+            atomic_path(labels_path) as tmp_labels_path:
+        values = np.lib.format.open_memmap(
+            tmp_values_path, mode='w+', dtype=np.float32,
+            shape=(n_rows, len(columns)))
+        labels = np.lib.format.open_memmap(
+            tmp_labels_path, mode='w+', dtype=np.int32, shape=(n_rows,))
+        loaded = map_files(read_columns, filepaths, columns, workers=workers)
+        for record, (file_values, file_labels) in zip(records, loaded):
+            if len(file_values) != record['stop'] - record['start']:
+                raise ValueError(f'File {record["file"]} has '
+                                 f'{len(file_values)} rows but '
+                                 f'{record["stop"] - record["start"]} lines')
+            values[record['start']:record['stop']] = file_values
+            labels[record['start']:record['stop']] = file_labels
+        values.flush()
+        labels.flush()
+        del values, labels
+    write_json(index_path, {'columns': columns, 'files': records})
+
+
+class SplitStore:
+    """
+    Read-only view of a split store: values and labels are memory-mapped and
+    index holds the case_id, idv, file and row span (start, stop) of every
+    file.
+    """
+
+    def __init__(self, split, root='.'):
+        values_path, labels_path, index_path = store_paths(split, root)
+        with open(index_path) as f:
+            meta = json.load(f)
+        self.columns = meta['columns']
+        self.index = meta['files']
+        self.records = {(record['case_id'], record['file']): record
+                        for record in self.index}
+        self.values = np.load(values_path, mmap_mode='r')
+        self.labels = np.load(labels_path, mmap_mode='r')
+
+    def select(self, case_id=None, idv=None):
+        """ Index records of the files of a case_id and/or idv. """
+        return [record for record in self.index
+                if (case_id is None or record['case_id'] == case_id)
+                and (idv is None or record['idv'] == idv)]
+
+    def read(self, case_id, file, start=0, stop=None):
+        """
+        Rows start:stop (relative to the file) of a file and their labels, as
+        views of the mapped store.
+        """
+        record = self.records[(case_id, file)]
+        first, last = record['start'], record['stop']
+        rows = slice(*slice(start, stop).indices(last - first))
+        rows = slice(first + rows.start, first + rows.stop)
+        return self.values[rows], self.labels[rows]
+
+
+if __name__ == '__main__':
+    for split in read_config()['subsets']:
+        print(f'Building store of {split}')
+        build_store(split)
@@ -0,0 +1,163 @@
+"""
+data_synth.py
+
+Generate a synthetic dataset shaped like the TE datasets described by a
+setup.json (splits, res/plant files, columns and fault labels), with a
+controllable size and injected defects, to profile the checker, the fixer
+and the split scripts without the real data.
+
+Usage: python data_synth.py DST [--files N] [--rows N] [--nan-files N]
+    [--flat-files N] [--untrimmed-esd] [--clean-cols]
+"""
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from data_checker import generate_col_list
+from data_loader import map_files, read_config
+
+# Fraction of the scenario before the fault starts and kept in ESD cases
+FAULT_ONSET = 0.2
+ESD_LENGTH = 0.6
+# Sampling time of 36 seconds, in hours
+SAMPLING_TIME = 0.01
+
+
+def write_case(task, settings):
+    """
+    Write the res and plant files of one scenario. Values are random walks,
+    so they only repeat where a flat-run defect is injected.
+    """
+    config = settings['config']
+    n_rows = config['length']
+    idv = task['idv']
+    rng = np.random.default_rng([settings['seed'], task['run']])
+    cols = generate_col_list(config['vars'], False)
+    data_cols = [col for col in cols if col != 'fault']
+    if idv in config['esd_idvs']:
+        res_len = int(n_rows * ESD_LENGTH)
+        plant_len = n_rows if settings['untrimmed_esd'] else res_len
+    else:
+        res_len = plant_len = n_rows
+    fault = np.zeros(n_rows, dtype=int)
+    fault[int(n_rows * FAULT_ONSET):] = idv
+    values = np.cumsum(
+        rng.normal(scale=0.1, size=(n_rows, len(data_cols))), axis=0)
+    index = pd.Index(np.arange(n_rows) * SAMPLING_TIME, name='Time')
+    name = f'IDV{idv}_{task["run"]}{config["extension"]}'
+    split_dir = os.path.join(settings['dst'], task['split'])
+
+    res_df = pd.DataFrame(values, index=index, columns=data_cols)
+    defect_col = task['defect_col']
+    if task['nan']:
+        res_df.iloc[rng.integers(res_len), data_cols.index(defect_col)] = \
+            np.nan
+    if task['flat']:
+        start = rng.integers(max(1, res_len - task['flat']))
+        col = data_cols.index(defect_col)
+        res_df.iloc[start:start + task['flat'], col] = res_df.iloc[start, col]
+    res_df['fault'] = fault
+    res_df.iloc[:res_len].to_csv(
+        os.path.join(split_dir, f'res_{name}'), float_format='%.8f')
+
+    plant_df = pd.DataFrame(
+        values + rng.normal(scale=0.01, size=values.shape),
+        index=index, columns=data_cols)
+    if settings['clean_cols']:
+        plant_df = pd.concat(
+            [plant_df, plant_df.filter(like='XMEAS(').add_suffix('_clean')],
+            axis=1)
+    plant_df['fault'] = fault
+    plant_df.iloc[:plant_len].to_csv(
+        os.path.join(split_dir, f'plant_{name}'), float_format='%.8f')
+
+
+def generate_dataset(dst, n_files=None, n_rows=None, vars=None, nan_files=0,
+                     flat_files=0, untrimmed_esd=False, clean_cols=False,
+                     seed=0, src='.', workers=None):
+    """
+    Write a synthetic dataset in dst following the setup.json of src.
+    :param n_files: files per case_id in every split (int) or per split
+        (dict); the subsets of setup.json by default
+    :param n_rows: rows per scenario; length of setup.json by default
+    :param vars: overrides of the setup.json vars, to change the columns
+    :param nan_files: number of res files with a NaN value
+    :param flat_files: number of res files with a run of equal values longer
+        than max_consecutive_times
+    :param untrimmed_esd: leave the plant files of the ESD IDVs untrimmed
+    :param clean_cols: add XMEAS(i)_clean columns to the plant files
+    """
+    config = read_config(src)
+    if isinstance(n_files, int):
+        config['subsets'] = dict.fromkeys(config['subsets'], n_files)
+    elif n_files is not None:
+        config['subsets'] = dict(n_files)
+    if n_rows is not None:
+        config['length'] = n_rows
+    if vars is not None:
+        config['vars'] = {**config['vars'], **vars}
+    config['has_clean_xmeas'] = False
+
+    os.makedirs(dst)
+    with open(os.path.join(dst, 'setup.json'), 'w') as f:
+        json.dump(config, f, indent=2)
+    for file in config['needed_files']:
+        if file != 'setup.json' and os.path.exists(os.path.join(src, file)):
+            shutil.copy2(os.path.join(src, file), dst)
+
+    # Scenarios: NOC for the train splits, every IDV in turn for the others
+    fault_idvs = list(range(21))
+    tasks = []
+    for split, n_split in config['subsets'].items():
+        os.makedirs(os.path.join(dst, split))
+        for i in range(n_split):
+            idv = 0 if split.startswith('train') else \
+                fault_idvs[i % len(fault_idvs)]
+            tasks.append({'split': split, 'idv': idv, 'run': len(tasks) + 1,
+                          'nan': False, 'flat': 0})
+
+    # Defects go to files and columns the checks do not ignore
+    rng = np.random.default_rng(seed)
+    checked = [i for i, task in enumerate(tasks)
+               if task['idv'] not in config['ignore_idvs']]
+    n_xmeas = config['vars']['XMEAS']
+    xmeas_cols = [f'XMEAS({i})' for i in range(1, n_xmeas + 1)
+                  if i not in config['ignore'].get('XMEAS', [])]
+    for i in rng.choice(checked, nan_files, replace=False):
+        tasks[i]['nan'] = True
+    for i in rng.choice(checked, flat_files, replace=False):
+        tasks[i]['flat'] = 2 * config['max_consecutive_times']
+    for task in tasks:
+        task['defect_col'] = xmeas_cols[rng.integers(len(xmeas_cols))]
+
+    settings = {'config': config, 'dst': dst, 'seed': seed,
+                'untrimmed_esd': untrimmed_esd, 'clean_cols': clean_cols}
+    for _ in map_files(write_case, tasks, settings, workers=workers):
+        pass
+    return config
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('dst', help='directory of the new dataset')
+    parser.add_argument('--files', type=int,
+                        help='files per case_id and split')
+    parser.add_argument('--rows', type=int, help='rows per scenario')
+    parser.add_argument('--xmeas', type=int, help='number of XMEAS columns')
+    parser.add_argument('--nan-files', type=int, default=0)
+    parser.add_argument('--flat-files', type=int, default=0)
+    parser.add_argument('--untrimmed-esd', action='store_true')
+    parser.add_argument('--clean-cols', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+    generate_dataset(
+        args.dst, args.files, args.rows,
+        vars={'XMEAS': args.xmeas} if args.xmeas else None,
+        nan_files=args.nan_files, flat_files=args.flat_files,
+        untrimmed_esd=args.untrimmed_esd, clean_cols=args.clean_cols,
+        seed=args.seed, workers=args.workers)
@@ -0,0 +1,144 @@
+"""
+data_validate.py
+
+Fix and check every dataset under a data root (each directory with a
+setup.json) in one process: the checks of data_checker run for all of them
+with one shared process pool and shared caches, instead of one interpreter
+per dataset. Checks are selected with --checks and --skip, e.g. --skip
+test_cols (see the data checking notes of readme.md).
+
+Usage: python data_validate.py ROOT [--fix] [--checks NAME ...]
+    [--skip NAME ...] [--workers N] [--incremental] [--chunksize N]
+    [--profile FILE]
+"""
+import argparse
+import os
+import re
+import sys
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+from data_checker import Test
+from data_fixer import DataFixer
+
+CHECKS = list(unittest.TestLoader().getTestCaseNames(Test))
+
+
+def find_datasets(root):
+    """
+    Sorted directories under root holding a setup.json. The directories of
+    a dataset (splits, caches) are not searched.
+    """
+    datasets = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if 'setup.json' in filenames:
+            datasets.append(dirpath)
+            dirnames[:] = []
+        else:
+            dirnames[:] = sorted(dirname for dirname in dirnames
+                                 if not dirname.startswith('.'))
+    return sorted(datasets)
+
+
+def check_name(name):
+    """ Full name of a check given with or without its 'test_' prefix. """
+    name = name if name.startswith('test_') else f'test_{name}'
+    if name not in CHECKS:
+        raise ValueError(f'Check {name} not in {CHECKS}')
+    return name
+
+
+def dataset_profile(profile, dataset, root):
+    """
+    Profile path of a dataset, so every dataset gets its own report: a
+    relative profile path is taken in the dataset directory, and an absolute
+    one gets the path of the dataset under root added to its name.
+    """
+    if not os.path.isabs(profile):
+        return os.path.join(dataset, profile)
+    base, ext = os.path.splitext(profile)
+    name = re.sub(r'\W', '_', os.path.relpath(dataset, root))
+    return f'{base}_{name}{ext}'
+
+
+def dataset_test(dataset, root, profile=None):
+    """
+    Subclass of data_checker.Test checking the dataset in dataset, with its
+    own profile path when profiling (with profile or DATA_CHECKER_PROFILE).
+    """
+    attrs = {'root': dataset, 'catalog': None, 'manifest': None,
+             'file_reports': None, 'byte_reports': None, 'profiler': None}
+    profile = profile or Test.profile
+    if profile:
+        attrs['profile'] = dataset_profile(profile, dataset, root)
+    name = 'Test_' + re.sub(r'\W', '_',
+                            os.path.basename(os.path.abspath(dataset)))
+    return type(name, (Test,), attrs)
+
+
+def validate(root, checks=None, skip=(), fix=False, workers=None,
+             incremental=None, chunksize=None, profile=None, verbosity=1):
+    """
+    Fix (with fix) and check every dataset under root, running the given
+    checks (all by default) but the skipped ones.
+    :return: unittest result of all the checks
+    """
+    names = [check_name(name) for name in checks] if checks else CHECKS
+    skip = {check_name(name) for name in skip}
+    names = [name for name in names if name not in skip]
+    datasets = find_datasets(root)
+    print(f'Found {len(datasets)} datasets under {root}')
+
+    if fix:
+        for dataset in datasets:
+            print(f'Fixing {dataset}')
+            DataFixer(dataset)()
+
+    if workers is not None:
+        Test.workers = workers
+    if incremental is not None:
+        Test.incremental = incremental
+    if chunksize is not None:
+        Test.chunksize = chunksize
+    test_classes = [dataset_test(dataset, root, profile)
+                    for dataset in datasets]
+    suite = unittest.TestSuite(test_class(name)
+                               for test_class in test_classes
+                               for name in names)
+    executor = None
+    if Test.workers > 1:
+        executor = Test.executor = ProcessPoolExecutor(
+            max_workers=Test.workers)
+    try:
+        return unittest.TextTestRunner(verbosity=verbosity).run(suite)
+    finally:
+        Test.executor = None
+        if executor is not None:
+            executor.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('root', help='directory holding the datasets')
+    parser.add_argument('--fix', action='store_true',
+                        help='run DataFixer on every dataset first')
+    parser.add_argument('--checks', nargs='+', metavar='NAME',
+                        help=f'checks to run (all by default): {CHECKS}')
+    parser.add_argument('--skip', nargs='+', default=[], metavar='NAME',
+                        help='checks not to run, e.g. test_cols')
+    parser.add_argument('--workers', type=int,
+                        help='processes of the pool shared by all datasets')
+    parser.add_argument('--incremental', action='store_true', default=None,
+                        help='reuse the results of previous runs')
+    parser.add_argument('--chunksize', type=int,
+                        help='stream files in chunks of this many rows')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='write the profile of every dataset to this '
+                             '.json or .csv in the dataset directory (or, if '
+                             'absolute, named after the dataset)')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+    result = validate(args.root, args.checks, args.skip, args.fix,
+                      args.workers, args.incremental, args.chunksize,
+                      args.profile, verbosity=2 if args.verbose else 1)
+    sys.exit(not result.wasSuccessful())